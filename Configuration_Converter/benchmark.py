@@ -0,0 +1,161 @@
+import argparse
+import os
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+from lark import Lark
+
+import main
+
+
+def letters(number):
+    """Имена языка не содержат цифр, поэтому номер записывается буквами."""
+    result = ""
+    while True:
+        number, digit = divmod(number, 26)
+        result += chr(97 + digit)
+        if number == 0:
+            return result
+
+
+def generate_config(pairs, constants=20, array_size=10):
+    """Синтетическая конфигурация: константы, числа, строки, вложенные массивы и выражения."""
+    lines = ["***> Синтетическая конфигурация для бенчмарка"]
+    for i in range(constants):
+        lines.append(f"set const_{letters(i)} = {i}")
+    lines.append("root {")
+    body = []
+    for i in range(pairs):
+        name = f"key_{letters(i)}"
+        kind = i % 4
+        if kind == 0:
+            value = str(i)
+        elif kind == 1:
+            value = f"[[строка номер {i}]]"
+        elif kind == 2:
+            items = " ".join(str(j) for j in range(array_size))
+            value = f"#({items} #([[вложенный]] {i}))"
+        else:
+            value = f"$+ const_{letters(i % constants)} {i}$"
+        body.append(f"    {name} = {value}")
+    lines.append(",\n".join(body))
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def timed(action, repeat=1):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = action()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def measure_peak(action):
+    tracemalloc.start()
+    try:
+        action()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_parsers(sizes, repeat, modes=main.PARSER_MODES):
+    print("Построение парсера:")
+    for label, options in (
+        ("earley", {}),
+        ("lalr без кэша", {"parser": "lalr"}),
+        ("lalr с кэшем", {"parser": "lalr", "cache": True}),
+    ):
+        elapsed, _ = timed(lambda: Lark(main.grammar, **options), repeat)
+        print(f"  {label:<16} {elapsed * 1000:10.2f} мс")
+    print("Разбор и преобразование (parse_config):")
+    for pairs in sizes:
+        text = generate_config(pairs)
+        print(f"  {pairs:>7} пар, {len(text) / 1024:8.1f} КиБ:")
+        for mode in modes:
+            main.get_parser(mode)
+            elapsed, output = timed(lambda: main.parse_config(text, mode), repeat)
+            if isinstance(output, str):
+                raise RuntimeError(output)
+            # Пик памяти измеряется отдельным прогоном: трассировка замедляет разбор
+            peak = measure_peak(lambda: main.parse_config(text, mode))
+            print(f"    {mode:<8} {elapsed:8.3f} с, пик {peak / 1024 / 1024:8.1f} МиБ")
+
+
+def bench_stream(sizes, repeat):
+    """Полный путь файл -> YAML: словарь и yaml.dump против потокового stream_config."""
+    def dump(source, output):
+        with open(source, "r", encoding="utf-8") as f:
+            main.dump_yaml(main.parse_config(f.read()), output)
+
+    def stream(source, output):
+        with open(source, "r", encoding="utf-8") as f:
+            error = main.stream_config(f, output)
+        if error is not None:
+            raise RuntimeError(error)
+
+    print("Вывод YAML (чтение из файла, запись в os.devnull):")
+    with tempfile.TemporaryDirectory() as work_dir:
+        source = os.path.join(work_dir, "config.txt")
+        for pairs in sizes:
+            with open(source, "w", encoding="utf-8") as f:
+                f.write(generate_config(pairs))
+            print(f"  {pairs:>7} пар, {os.path.getsize(source) / 1024:8.1f} КиБ:")
+            with open(os.devnull, "w", encoding="utf-8") as output:
+                for label, action in (("yaml.dump", dump), ("stream", stream)):
+                    elapsed, _ = timed(lambda: action(source, output), repeat)
+                    peak = measure_peak(lambda: action(source, output))
+                    print(f"    {label:<9} {elapsed:8.3f} с, пик {peak / 1024 / 1024:8.1f} МиБ")
+
+
+def generate_nested(pairs, depth=6, width=4):
+    """Конфигурация с глубоко вложенными массивами: на каждую пару - дерево глубины depth."""
+    def nested(level, seed):
+        if level == 0:
+            return f"[[лист {seed}]]" if seed % 2 else str(seed)
+        return "#(" + " ".join(nested(level - 1, seed * width + j) for j in range(width)) + ")"
+
+    body = [f"    key_{letters(i)} = {nested(depth if i % 2 else 1, i)}" for i in range(pairs)]
+    return "root {\n" + ",\n".join(body) + "\n}"
+
+
+def bench_emitters(sizes, repeat):
+    """Запись уже разобранной конфигурации каждым форматом вывода; ускорение считается от yaml-py."""
+    print(f"Форматы вывода (yaml = {main.YamlDumper.__name__}):")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for pairs in sizes:
+            data = main.load_config(generate_nested(pairs))
+            print(f"  {pairs:>7} пар с вложенными массивами:")
+            results = {}
+            for emitter in main.EMITTERS:
+                path = os.path.join(work_dir, f"out{main.EMITTERS[emitter][0]}")
+                elapsed, _ = timed(lambda: main.write_output(data, path, emitter), repeat)
+                results[emitter] = elapsed, os.path.getsize(path)
+            for emitter, (elapsed, size) in results.items():
+                speedup = results["yaml-py"][0] / elapsed
+                print(f"    {emitter:<8} {elapsed:8.3f} с, {size / 1024:9.1f} КиБ, x{speedup:.1f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Сравнение режимов разбора конфигурационного языка")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Число пар в конфигурации")
+    parser.add_argument("--repeat", type=int, default=1, help="Число повторов (берётся лучшее время)")
+    parser.add_argument("--modes", nargs="+", choices=main.PARSER_MODES, default=list(main.PARSER_MODES),
+                        help="Сравниваемые режимы разбора")
+    parser.add_argument("--stream", action="store_true", help="Сравнить также потоковый вывод YAML")
+    parser.add_argument("--emitters", action="store_true", help="Сравнить только форматы вывода")
+    args = parser.parse_args()
+    if args.emitters:
+        bench_emitters(args.sizes, args.repeat)
+        return
+    bench_parsers(args.sizes, args.repeat, args.modes)
+    if args.stream:
+        bench_stream(args.sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,100 @@
+import os
+import json
+import shutil
+import hashlib
+
+
+def content_key(fingerprint, text, dependencies=()):
+    """
+    Ключ кэша: sha256 от отпечатка грамматики и версий, текста конфигурации
+    и списка зависимостей (импортируемых модулей с их mtime_ns и размером).
+    """
+    digest = hashlib.sha256(fingerprint.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(repr([tuple(dependency) for dependency in dependencies]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """
+    Постоянный кэш преобразований. Готовый результат хранится в objects/<ключ>.out,
+    manifest.json связывает входной файл с ключом и выходным файлом.
+    Если отпечаток грамматики или версий изменился, кэш очищается.
+    Объекты, на которые не ссылается ни один входной файл, удаляются при save.
+    """
+    MANIFEST = "manifest.json"
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.objects_path = os.path.join(path, "objects")
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        manifest = self._read()
+        if manifest is not None and manifest.get("fingerprint") == fingerprint:
+            self.entries = manifest.get("entries", {})
+        else:
+            shutil.rmtree(self.objects_path, ignore_errors=True)
+        os.makedirs(self.objects_path, exist_ok=True)
+
+    def _read(self):
+        try:
+            with open(os.path.join(self.path, self.MANIFEST), "r", encoding="utf-8") as manifest:
+                return json.load(manifest)
+        except (OSError, ValueError):
+            return None
+
+    def key(self, text, dependencies=()):
+        return content_key(self.fingerprint, text, dependencies)
+
+    def object_path(self, key):
+        return os.path.join(self.objects_path, f"{key}.out")
+
+    def restore(self, source, key, output):
+        """
+        Выходной файл для неизменённого входа: если запись совпадает и файл
+        на месте, ничего не делается, иначе результат копируется из кэша.
+        Возвращает False, если результата для ключа нет.
+        """
+        source = os.path.abspath(source)
+        entry = {"key": key, "output": output}
+        if self.entries.get(source) == entry and os.path.exists(output):
+            self.hits += 1
+            return True
+        if not os.path.exists(self.object_path(key)):
+            self.misses += 1
+            return False
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        shutil.copyfile(self.object_path(key), output)
+        self.entries[source] = entry
+        self.hits += 1
+        return True
+
+    def store(self, source, key, output):
+        """Сохранение только что записанного выходного файла под ключом его входа."""
+        temp_path = f"{self.object_path(key)}.tmp"
+        shutil.copyfile(output, temp_path)
+        os.replace(temp_path, self.object_path(key))
+        self.entries[os.path.abspath(source)] = {"key": key, "output": output}
+
+    def evict(self, source):
+        """Удаление записи удалённого входного файла; возвращает запись или None."""
+        return self.entries.pop(os.path.abspath(source), None)
+
+    def prune(self):
+        """Удаление записей входных файлов, которых больше нет на диске."""
+        for source in [source for source in self.entries if not os.path.exists(source)]:
+            del self.entries[source]
+
+    def save(self):
+        used = {f"{entry['key']}.out" for entry in self.entries.values()}
+        for name in os.listdir(self.objects_path):
+            if name not in used:
+                os.remove(os.path.join(self.objects_path, name))
+        temp_path = os.path.join(self.path, f"{self.MANIFEST}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as manifest:
+            json.dump({"fingerprint": self.fingerprint, "entries": self.entries}, manifest, ensure_ascii=False)
+        os.replace(temp_path, os.path.join(self.path, self.MANIFEST))
@@ -1,13 +1,39 @@
+import os
+import re
 import sys
+import glob
+import json
+import marshal
+import argparse
+import time
+from time import perf_counter
+from types import MappingProxyType
+from concurrent.futures import ProcessPoolExecutor
 import yaml
-from lark import Lark, Transformer, exceptions, LarkError, Tree
+import lark
+from lark import Lark, Transformer, Token, TextSlice, exceptions, LarkError
 
-# Грамматика конфигурационного языка
+from cache import ConversionCache, content_key
+from profiling import PipelineProfile
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Эмиттер libyaml, если PyYAML собран с ним, иначе реализация на Python
+YamlDumper = getattr(yaml, "CDumper", yaml.Dumper)
+
+# Грамматика конфигурационного языка. module - файл модуля констант,
+# который документы подключают через import
 grammar = """
-start: (const_decl | COMMENT)* config
+start: import_decl* const_decl* config
+module: const_decl*
 
 COMMENT: "***>" /.+/
 
+import_decl: "import" STRING
+
 config: NAME conf
 conf: "{" [pair ("," pair)*] "}"
 
@@ -20,7 +46,7 @@ operation: "+" NAME NUMBER -> add_op
 
 value: NUMBER | STRING | array | const_eval
 
-array: "#(" [value*] ")"
+array: "#(" value* ")"
 pair: NAME "=" value
 
 NAME: /[_a-zA-Z]+/
@@ -32,21 +58,194 @@ STRING: "[[" /[^\\[\\]]*/ "]]"
 %ignore COMMENT
 """
 
-# Инициализация Lark парсера
-config_parser = Lark(grammar)
+# Грамматика потокового режима: тот же язык, но правила разбиты так, чтобы
+# каждая свёртка соответствовала событию YAML. Списки пар и элементов массива
+# леворекурсивны и сворачиваются в None, поэтому стек разбора не растёт.
+# Значения констант по-прежнему собираются целиком (const_value)
+stream_grammar = """
+start: import_decl* const_decl* config
+
+COMMENT: "***>" /.+/
+
+import_decl: "import" STRING
+
+config: config_open [pairs] "}"
+config_open: NAME "{"
+pairs: pair | pairs "," pair
+pair: pair_key "=" value
+pair_key: NAME
+
+const_decl: "set" NAME "=" const_value
+const_value: NUMBER | STRING | const_array | const_eval
+const_array: "#(" const_value* ")"
+const_eval: "$" operation "$"
+
+operation: "+" NAME NUMBER -> add_op
+        | "chr" "(" NUMBER ")" -> chr_op
+        | "mod" "(" NUMBER "," NUMBER ")" -> mod_op
+
+value: scalar | array
+scalar: NUMBER | STRING | const_eval
+array: array_open items ")"
+array_open: "#("
+items: | items value
+
+NAME: /[_a-zA-Z]+/
+STRING: "[[" /[^\\[\\]]*/ "]]"
+
+%import common.NUMBER
+%import common.WS
+%ignore WS
+%ignore COMMENT
+"""
+
+# Инициализация Lark парсера. Таблицы LALR кэшируются на диске (во временном
+# каталоге) и перестраиваются только при изменении грамматики или версии Lark
+config_parser = Lark(grammar, parser="lalr", cache=True)
+
+# inline - LALR со встроенным преобразователем, без промежуточного дерева;
+# lalr и earley строят дерево разбора и затем обходят его ConfigTransformer
+PARSER_MODES = ("inline", "lalr", "earley")
+_parsers = {"lalr": config_parser}
+
+def get_parser(mode):
+    if mode not in PARSER_MODES:
+        raise ValueError(f"Неизвестный режим разбора {mode}")
+    if mode not in _parsers:
+        if mode == "inline":
+            _parsers[mode] = Lark(grammar, parser="lalr", cache=True, transformer=InlineTransformer())
+        else:
+            _parsers[mode] = Lark(grammar)
+    return _parsers[mode]
+
+def get_module_parser():
+    # Отдельный парсер со своим преобразователем: модуль загружается посреди
+    # разбора документа и не должен затрагивать его константы
+    if "module" not in _parsers:
+        _parsers["module"] = Lark(grammar, parser="lalr", cache=True, start="module", transformer=InlineTransformer())
+    return _parsers["module"]
+
+# Каталоги поиска модулей констант после каталога документа (ключ --lib)
+LIBRARY_PATH = []
+
+# Загруженные модули: абсолютный путь -> ((mtime_ns, размер), константы)
+_modules = {}
+
+# Импорты для ключей кэша ищутся без разбора: все import документа, в том числе
+# несколько в одной строке. Совпадение в комментарии лишь добавляет лишнюю
+# зависимость - кэш сбросится чаще, но не устареет
+IMPORT_PATTERN = re.compile(r"\bimport\s*\[\[([^\[\]]*)\]\]")
+
+def resolve_module(name, base_dir=None):
+    """Путь модуля констант: абсолютный, относительно каталога документа или из LIBRARY_PATH."""
+    for directory in [base_dir or "."] + LIBRARY_PATH:
+        path = os.path.abspath(os.path.join(directory, name))
+        if os.path.isfile(path):
+            return path
+    raise LarkError(f"Модуль констант {name} не найден")
+
+def freeze(value):
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def module_fingerprint():
+    return "\n".join([grammar, lark.__version__])
+
+def read_module_cache(path, key):
+    try:
+        with open(f"{path}.constants", "rb") as f:
+            data = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(data, dict) or data.get("fingerprint") != module_fingerprint() or data.get("key") != key:
+        return None
+    return data.get("constants")
+
+def save_module_cache(path, key, constants):
+    temp_path = f"{path}.constants.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            marshal.dump({"fingerprint": module_fingerprint(), "key": key, "constants": constants}, f)
+        os.replace(temp_path, f"{path}.constants")
+    except OSError:
+        pass  # Без кэша на диске модуль просто будет разобран заново
+
+def load_module(path):
+    """
+    Модуль констант: разбирается один раз, выражения $...$ вычисляются при
+    разборе, результат замораживается (массивы становятся кортежами) и
+    кэшируется в процессе и на диске рядом с модулем (<модуль>.constants).
+    Кэш проверяется по времени изменения и размеру файла.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _modules.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    constants = read_module_cache(path, key)
+    if constants is None:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        parser = get_module_parser()
+        parser.options.transformer.reset(os.path.dirname(path))
+        try:
+            constants = parser.parse(text)
+        except CONFIG_ERRORS as e:
+            raise LarkError(f"Ошибка в модуле констант {path}:\n{str(e)}")
+        save_module_cache(path, key, constants)
+    module = MappingProxyType({name: freeze(value) for name, value in constants.items()})
+    _modules[path] = (key, module)
+    return module
+
+def module_dependencies(text, base_dir=None):
+    """Импортируемые документом модули с (mtime_ns, размер) - для ключей кэша и режима наблюдения."""
+    dependencies = []
+    for name in IMPORT_PATTERN.findall(text):
+        try:
+            path = resolve_module(name, base_dir)
+            stat = os.stat(path)
+            dependencies.append((path, stat.st_mtime_ns, stat.st_size))
+        except (LarkError, OSError):
+            dependencies.append((name, None, None))
+    return dependencies
 
 class ConfigTransformer(Transformer):
-    def __init__(self):
+    def __init__(self, base_dir=None):
         super().__init__()
         self.constants = {}  # Хранилище для констант
+        self.base_dir = base_dir  # Каталог документа для поиска модулей
+        self.modules = []  # Импортированные модули: (путь, константы)
 
     def start(self, value):
         return value[-1]
 
+    def module(self, items):
+        return self.constants
+
+    def origin(self, name):
+        for path, module in self.modules:
+            if name in module:
+                return f" в модуле {path}"
+        return ""
+
+    def import_decl(self, items):
+        path = resolve_module(items[0], self.base_dir)
+        module = load_module(path)
+        # Пересечение множеств ключей и обновление словаря выполняются на C,
+        # а поиск константы остаётся одним обращением к словарю
+        conflicts = module.keys() & self.constants.keys()
+        if conflicts:
+            name = min(conflicts)
+            raise LarkError(f"Константа {name} из модуля {path} уже объявлена{self.origin(name)}")
+        self.constants.update(module)
+        self.modules.append((path, module))
+        return None
+
     def const_decl(self, tupl):
         name, value = tupl
         if name in self.constants:
-            raise LarkError(f"Константа {name} уже объявлена")
+            raise LarkError(f"Константа {name} уже объявлена{self.origin(name)}")
         self.constants[name] = value
         return None
 
@@ -58,10 +257,16 @@ class ConfigTransformer(Transformer):
 
     def chr_op(self, items):
         number = int(items[0])
+        # Ошибки проверяются здесь: во встроенном в LALR преобразователе
+        # исключения не оборачиваются в VisitError
+        if not 0 <= number <= 0x10FFFF:
+            raise ValueError(f"Аргумент chr вне диапазона 0..0x10FFFF: {number}")
         return chr(number)
 
     def mod_op(self, items):
         a, b = int(items[0]), int(items[1])
+        if b == 0:
+            raise ValueError(f"Деление на ноль в mod({a}, {b})")
         return a % b
 
     def const_eval(self, items):
@@ -88,10 +293,7 @@ class ConfigTransformer(Transformer):
         return str(token)
 
     def value(self, tupl):
-        val = tupl[0]
-        if isinstance(val, Tree):
-            return self.transform(val)
-        return val
+        return tupl[0]
 
     def conf(self, items):
         result = {}
@@ -101,29 +303,604 @@ class ConfigTransformer(Transformer):
                 result[key] = value
         return result
 
-# Функция для парсинга и обработки ошибок
-def parse_config(input_text):
+class InlineTransformer(ConfigTransformer):
+    """
+    Преобразователь, встроенный в LALR парсер: каждое правило сворачивается
+    в значение сразу при свёртке, константы вычисляются по ходу разбора.
+    Колбэки лексера обязаны возвращать Token, поэтому терминалы
+    приводятся к значениям в правилах, а не в методах NAME/NUMBER/STRING.
+    """
+    NAME = NUMBER = STRING = None
+
+    def reset(self, base_dir=None):
+        self.constants = {}
+        self.base_dir = base_dir
+        self.modules = []
+
+    def token_value(self, token):
+        if token.type == "NUMBER":
+            return int(token)
+        if token.type == "STRING":
+            return str(token)[2:-2]
+        return str(token)
+
+    def const_decl(self, tupl):
+        name, value = tupl
+        return super().const_decl((str(name), value))
+
+    def import_decl(self, items):
+        return super().import_decl((self.token_value(items[0]),))
+
+    def add_op(self, items):
+        name, number = items
+        return super().add_op((str(name), number))
+
+    def config(self, value):
+        name, conf = value
+        return {str(name): conf}
+
+    def pair(self, value):
+        key, val = value
+        return (str(key), val)
+
+    def value(self, tupl):
+        val = tupl[0]
+        if isinstance(val, Token):
+            return self.token_value(val)
+        return val
+
+# Ошибки разбора и вычисления констант: исключения Lark и ошибки встроенного преобразователя
+CONFIG_ERRORS = (exceptions.LarkError, ValueError, TypeError)
+
+def error_message(error):
+    if isinstance(error, exceptions.UnexpectedInput):
+        return f"Ошибка в синтаксисе:\n{str(error)}"
+    return f"Ошибка при обработке:\n{str(error)}"
+
+class StreamTransformer(InlineTransformer):
+    """
+    Встроенный преобразователь потокового режима: при свёртке правил
+    передаёт события YAML эмиттеру вместо построения словаря. Каждое
+    правило возвращает None, чтобы в стеке разбора не копились значения.
+    """
+    def begin(self, dumper, base_dir=None):
+        self.reset(base_dir)
+        self.dumper = dumper
+
+    def emit_value(self, value):
+        # Узел строит представитель PyYAML, а неявность тега определяется так же,
+        # как в Serializer, поэтому вывод совпадает с yaml.dump и для CDumper
+        node = self.dumper.represent_data(value)
+        detected_tag = self.dumper.resolve(yaml.ScalarNode, node.value, (True, False))
+        default_tag = self.dumper.resolve(yaml.ScalarNode, node.value, (False, True))
+        implicit = (node.tag == detected_tag), (node.tag == default_tag)
+        self.dumper.emit(yaml.ScalarEvent(None, node.tag, implicit, node.value, style=node.style))
+
+    def start(self, items):
+        return None
+
+    def config_open(self, items):
+        self.dumper.emit(yaml.MappingStartEvent(None, None, True, flow_style=False))
+        self.emit_value(str(items[0]))
+        self.dumper.emit(yaml.MappingStartEvent(None, None, True, flow_style=False))
+
+    def config(self, items):
+        self.dumper.emit(yaml.MappingEndEvent())
+        self.dumper.emit(yaml.MappingEndEvent())
+
+    def pairs(self, items):
+        return None
+
+    def pair(self, items):
+        return None
+
+    def pair_key(self, items):
+        self.emit_value(str(items[0]))
+
+    def const_value(self, items):
+        return InlineTransformer.value(self, items)
+
+    def const_array(self, items):
+        return list(items)
+
+    def value(self, items):
+        return None
+
+    def scalar(self, items):
+        self.emit_value(InlineTransformer.value(self, items))
+
+    def array_open(self, items):
+        self.dumper.emit(yaml.SequenceStartEvent(None, None, True, flow_style=False))
+
+    def array(self, items):
+        self.dumper.emit(yaml.SequenceEndEvent())
+
+    def items(self, items):
+        return None
+
+def get_stream_parser():
+    if "stream" not in _parsers:
+        _parsers["stream"] = Lark(stream_grammar, parser="lalr", cache=True, transformer=StreamTransformer())
+    return _parsers["stream"]
+
+def stream_tokens(input_stream, interactive, lexers, chunk_size):
+    """
+    Токены из потока для интерактивного LALR парсера. Текст читается
+    кусками, в буфере хранится только необработанный хвост. Лексер
+    выбирается по состоянию парсера, как в контекстном лексере Lark.
+    Токен, упирающийся в конец буфера, может продолжаться, поэтому
+    перед его выдачей дочитывается следующий кусок.
+    """
+    buffer, pos, eof = "", 0, False
+    text = TextSlice(buffer, 0, None)
+    offset, line, column = 0, 1, 1
+    read_size = chunk_size
+    while not eof or pos < len(buffer):
+        lexer = lexers[interactive.parser_state.position]
+        match = lexer.match(text, pos) if pos < len(buffer) else None
+        if not eof and (match is None or pos + len(match[0]) == len(buffer)):
+            # Если в буфере нет целого токена, следующий кусок читается вдвое больше
+            read_size = read_size * 2 if pos == 0 and buffer else chunk_size
+            chunk = input_stream.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            text = TextSlice(buffer, 0, None)
+            pos = 0
+            continue
+        if match is None:
+            allowed = lexer.scanner.allowed_types - lexer.ignore_types
+            raise exceptions.UnexpectedCharacters(buffer, pos, line, column, allowed=allowed)
+        value, type_ = match
+        token = None if type_ in lexer.ignore_types else Token(type_, value, offset, line, column)
+        pos += len(value)
+        offset += len(value)
+        newlines = value.count("\n")
+        if newlines:
+            line += newlines
+            column = len(value) - value.rfind("\n")
+        else:
+            column += len(value)
+        if token is None:
+            continue
+        if type_ in lexer.callback:
+            token = lexer.callback[type_](token)
+        yield token
+
+def stream_config(input_stream, output_stream, chunk_size=1 << 16, dumper_class=None, base_dir=None):
+    """
+    Потоковое преобразование: текст читается из input_stream кусками,
+    события YAML пишутся в output_stream по мере свёртки пар и элементов
+    массивов. Возвращает None или сообщение об ошибке, как parse_config;
+    при ошибке в output_stream уже может быть записана часть документа.
+    """
+    parser = get_stream_parser()
+    transformer = parser.options.transformer
+    dumper = (dumper_class or YamlDumper)(output_stream, allow_unicode=True, sort_keys=False)
+    transformer.begin(dumper, base_dir)
     try:
-        # Парсинг входного текста
-        tree = config_parser.parse(input_text)
+        dumper.open()
+        dumper.emit(yaml.DocumentStartEvent(explicit=False))
+        interactive = parser.parse_interactive()
+        lexers = parser.parser.lexer.lexers
+        token = None
+        for token in stream_tokens(input_stream, interactive, lexers, chunk_size):
+            interactive.feed_token(token)
+        interactive.feed_eof(token)
+        dumper.emit(yaml.DocumentEndEvent(explicit=False))
+        dumper.close()
+        return None
+    except CONFIG_ERRORS as e:
+        return error_message(e)
+    finally:
+        transformer.dumper = None
+        dumper.dispose()
 
-        # Преобразование дерева в словарь
-        transformer = ConfigTransformer()
-        yaml_dict = transformer.transform(tree)
+def count_nodes(value):
+    """Число узлов результата: словари, списки и скалярные значения."""
+    if isinstance(value, dict):
+        return 1 + sum(count_nodes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return 1 + sum(count_nodes(item) for item in value)
+    return 1
+
+def profile_config(input_text, mode, base_dir, profile):
+    """
+    load_config с замерами стадий в profile (PipelineProfile). Стадия lex - отдельный
+    проход лексера для подсчёта токенов, parse включает лексер повторно. В режиме inline
+    значения вычисляются при разборе, поэтому parse и transform - одна стадия.
+    """
+    parser = get_parser(mode)
+    with profile.stage("lex") as record:
+        tokens = sum(1 for _ in parser.lex(input_text))
+    record["tokens"] = tokens
+    if mode == "inline":
+        with profile.stage("parse+transform") as record:
+            parser.options.transformer.reset(base_dir)
+            yaml_dict = parser.parse(input_text)
+        record["values"] = count_nodes(yaml_dict)
         return yaml_dict
-    except exceptions.UnexpectedCharacters as uc:
-        return f"Ошибка в синтаксисе:\n{str(uc)}"
-    except exceptions.LarkError as le:
-        return f"Ошибка при обработке:\n{str(le)}"
+    with profile.stage("parse") as record:
+        tree = parser.parse(input_text)
+    record["nodes"] = sum(1 for _ in tree.iter_subtrees())
+    with profile.stage("transform") as record:
+        yaml_dict = ConfigTransformer(base_dir).transform(tree)
+    record["values"] = count_nodes(yaml_dict)
+    return yaml_dict
+
+def load_config(input_text, mode="inline", base_dir=None, profile=None):
+    """
+    Разбор конфигурации в словарь; ошибки CONFIG_ERRORS передаются вызывающему.
+    base_dir - каталог документа, от которого ищутся модули import.
+    profile - PipelineProfile для замеров стадий (без него замеры не выполняются).
+    """
+    if profile is not None:
+        return profile_config(input_text, mode, base_dir, profile)
+    parser = get_parser(mode)
+    if mode == "inline":
+        # Преобразователь общий для всех разборов, константы сбрасываются перед каждым
+        parser.options.transformer.reset(base_dir)
+        return parser.parse(input_text)
+
+    # Парсинг входного текста
+    tree = parser.parse(input_text)
+
+    # Преобразование дерева в словарь
+    transformer = ConfigTransformer(base_dir)
+    yaml_dict = transformer.transform(tree)
+    return yaml_dict
+
+# Функция для парсинга и обработки ошибок
+def parse_config(input_text, mode="inline", base_dir=None, profile=None):
+    try:
+        return load_config(input_text, mode, base_dir, profile)
+    except CONFIG_ERRORS as e:
+        return error_message(e)
+
+def init_worker(mode, library_path=()):
+    # Парсер строится один раз на процесс пакетного режима (таблицы LALR берутся из кэша)
+    get_parser(mode)
+    LIBRARY_PATH[:] = library_path
+
+def dump_yaml(data, stream):
+    yaml.dump(data, stream, Dumper=YamlDumper, allow_unicode=True, sort_keys=False)
+
+def dump_yaml_py(data, stream):
+    yaml.dump(data, stream, Dumper=yaml.Dumper, allow_unicode=True, sort_keys=False)
+
+def dump_json(data, stream):
+    json.dump(data, stream, ensure_ascii=False, separators=(",", ":"))
+
+def dump_marshal(data, stream):
+    marshal.dump(data, stream)
+
+def dump_msgpack(data, stream):
+    stream.write(msgpack.packb(data))
+
+# Форматы вывода: имя -> (расширение файла, двоичный ли формат, функция записи).
+# yaml - через libyaml, если он доступен; yaml-py - всегда реализация на Python
+EMITTERS = {
+    "yaml": (".yaml", False, dump_yaml),
+    "yaml-py": (".yaml", False, dump_yaml_py),
+    "json": (".json", False, dump_json),
+    "marshal": (".marshal", True, dump_marshal),
+}
+if msgpack is not None:
+    EMITTERS["msgpack"] = (".msgpack", True, dump_msgpack)
+
+def write_output(data, path, emitter="yaml"):
+    extension, binary, dump = EMITTERS[emitter]
+    if binary:
+        with open(path, "wb") as f:
+            dump(data, f)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            dump(data, f)
+
+def cache_fingerprint(emitter="yaml"):
+    """Отпечаток для ключей кэша: грамматики, версии lark и PyYAML и формат вывода."""
+    dumper = YamlDumper.__name__ if emitter == "yaml" else ""
+    return "\n".join([grammar, stream_grammar, lark.__version__, yaml.__version__, emitter, dumper])
+
+def convert_file(task):
+    """
+    Преобразование одного файла пакетного режима. Возвращает словарь
+    с результатом; при ошибке YAML не записывается, а в результате
+    указываются вид ошибки, сообщение и позиция. Если передан отпечаток
+    кэша, в результат добавляется ключ прочитанного текста и его модулей.
+    """
+    source, target, mode, fingerprint, emitter = task
+    start = perf_counter()
+    result = {"source": source, "output": None, "ok": False, "cached": False, "key": None, "modules": [],
+              "error": None, "message": None, "line": None, "column": None, "seconds": None}
+    try:
+        with open(source, "r", encoding="utf-8") as f:
+            text = f.read()
+        base_dir = os.path.dirname(source)
+        result["modules"] = module_dependencies(text, base_dir)
+        if fingerprint is not None:
+            result["key"] = content_key(fingerprint, text, result["modules"])
+        yaml_dict = load_config(text, mode, base_dir)
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        try:
+            write_output(yaml_dict, target, emitter)
+        except BaseException:
+            # Частично записанный файл удаляется: для файлов с ошибками вывода нет
+            if os.path.exists(target):
+                os.remove(target)
+            raise
+        result["ok"] = True
+        result["output"] = target
+    except CONFIG_ERRORS as e:
+        result["error"] = "syntax" if isinstance(e, exceptions.UnexpectedInput) else "processing"
+        result["message"] = str(e)
+        result["line"] = getattr(e, "line", None)
+        result["column"] = getattr(e, "column", None)
+    except (OSError, UnicodeDecodeError) as e:
+        result["error"] = "io"
+        result["message"] = str(e)
+    except Exception as e:
+        # Непредвиденная ошибка одного файла не должна прерывать весь пакет
+        result["error"] = "internal"
+        result["message"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = perf_counter() - start
+    return result
+
+def collect_sources(pattern):
+    """
+    Файлы пакетного режима и каталог, относительно которого строятся пути
+    результатов: сам каталог или часть шаблона до первого спецсимвола glob.
+    """
+    if os.path.isdir(pattern):
+        base = pattern
+        sources = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        sources = glob.glob(pattern, recursive=True)
+        parts = []
+        for part in pattern.replace("\\", "/").split("/")[:-1]:
+            if glob.has_magic(part):
+                break
+            parts.append(part)
+        base = "/".join(parts) or ("/" if pattern.startswith("/") else ".")
+    sources = sorted(source for source in sources if os.path.isfile(source))
+    return sources, base
+
+def output_path(source, base, output_dir, extension=".yaml"):
+    relative = os.path.relpath(os.path.abspath(source), os.path.abspath(base))
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + extension)
+
+def cached_result(source, target, modules, start):
+    return {"source": source, "output": target, "ok": True, "cached": True, "key": None, "modules": modules,
+            "error": None, "message": None, "line": None, "column": None, "seconds": perf_counter() - start}
+
+def convert_sources(sources, base, output_dir, jobs=None, mode="inline", cache=None, emitter="yaml"):
+    """
+    Преобразование списка файлов. С кэшем файлы, у которых не изменились
+    содержимое и импортируемые модули, берутся из него без разбора, остальные
+    преобразуются пулом процессов (или в текущем процессе, если файл один
+    или jobs == 1) и сохраняются в кэш.
+    """
+    results = [None] * len(sources)
+    tasks, positions = [], []
+    fingerprint = cache.fingerprint if cache is not None else None
+    for i, source in enumerate(sources):
+        target = output_path(source, base, output_dir, EMITTERS[emitter][0])
+        if cache is not None:
+            start = perf_counter()
+            try:
+                with open(source, "r", encoding="utf-8") as f:
+                    text = f.read()
+                modules = module_dependencies(text, os.path.dirname(source))
+                if cache.restore(source, cache.key(text, modules), target):
+                    results[i] = cached_result(source, target, modules, start)
+                    continue
+            except (OSError, UnicodeDecodeError):
+                pass  # Ошибку чтения сообщит convert_file
+        tasks.append((source, target, mode, fingerprint, emitter))
+        positions.append(i)
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) == 1:
+        init_worker(mode, list(LIBRARY_PATH))
+        converted = [convert_file(task) for task in tasks]
+    elif tasks:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(mode, list(LIBRARY_PATH))) as executor:
+            # Файлы передаются пачками, чтобы на каждый не приходилась отдельная пересылка между процессами
+            chunksize = max(1, len(tasks) // (jobs * 8))
+            converted = list(executor.map(convert_file, tasks, chunksize=chunksize))
+    else:
+        converted = []
+    for i, result in zip(positions, converted):
+        # Ключ вычислен по тексту, который разобрал процесс, поэтому файл, изменённый
+        # между проверкой кэша и разбором, не попадёт в кэш под старым ключом
+        if cache is not None and result["ok"]:
+            cache.store(result["source"], result["key"], result["output"])
+        results[i] = result
+    if cache is not None:
+        cache.save()
+    return results
+
+def batch_convert(pattern, output_dir, jobs=None, mode="inline", cache=None, emitter="yaml"):
+    """
+    Пакетное преобразование каталога или glob-шаблона пулом процессов.
+    Каждый процесс держит один построенный парсер. Результаты файлов
+    возвращаются в порядке sources, вместе с общим временем. С кэшем
+    из него удаляются записи входных файлов, которых больше нет.
+    """
+    start = perf_counter()
+    sources, base = collect_sources(pattern)
+    if cache is not None:
+        cache.prune()
+    results = convert_sources(sources, base, output_dir, jobs, mode, cache, emitter)
+    return results, perf_counter() - start
+
+def watch_step(pattern, output_dir, cache, state, jobs=None, mode="inline", emitter="yaml"):
+    """
+    Один проход режима наблюдения. state - словарь путь -> ((mtime_ns, размер),
+    импортируемые модули с их mtime_ns и размером) с прошлого прохода,
+    обновляется на месте. Новые файлы и файлы, изменившиеся сами или через
+    свои модули, преобразуются через кэш; для удалённых удаляются запись
+    кэша и выходной файл. Возвращает результаты и список удалённых файлов.
+    """
+    sources, base = collect_sources(pattern)
+    stats = {}
+    for source in sources:
+        try:
+            stat = os.stat(source)
+        except FileNotFoundError:
+            continue
+        stats[source] = (stat.st_mtime_ns, stat.st_size)
+    module_stats = {}
+
+    def module_changed(source, path, mtime_ns, size):
+        if mtime_ns is None:
+            # Ненайденный модуль хранится по имени из import: документ
+            # меняется, когда модуль появится рядом с ним или в LIBRARY_PATH
+            try:
+                resolve_module(path, os.path.dirname(source))
+            except LarkError:
+                return False
+            return True
+        if path not in module_stats:
+            try:
+                stat = os.stat(path)
+                module_stats[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                module_stats[path] = (None, None)
+        return module_stats[path] != (mtime_ns, size)
+
+    changed = [source for source in stats if source not in state or state[source][0] != stats[source]
+               or any(module_changed(source, *module) for module in state[source][1])]
+    deleted = [source for source in state if source not in stats]
+    for source in deleted:
+        del state[source]
+        entry = cache.evict(source)
+        if entry is not None and os.path.exists(entry["output"]):
+            os.remove(entry["output"])
+    results = convert_sources(changed, base, output_dir, jobs, mode, cache, emitter) if changed or deleted else []
+    for result in results:
+        state[result["source"]] = (stats[result["source"]], [tuple(module) for module in result["modules"]])
+    if deleted and not changed:
+        cache.save()
+    return results, deleted
+
+def watch(pattern, output_dir, cache, jobs=None, mode="inline", interval=1.0, emitter="yaml"):
+    """
+    Режим наблюдения: каталог опрашивается раз в interval секунд (только
+    стандартная библиотека, без системных уведомлений), отчёт выводится
+    после каждого прохода с изменениями. Останавливается по Ctrl+C.
+    """
+    state = {}
+    try:
+        while True:
+            start = perf_counter()
+            results, deleted = watch_step(pattern, output_dir, cache, state, jobs, mode, emitter)
+            if results:
+                print_batch_report(results, perf_counter() - start)
+            for source in deleted:
+                print(f"Удалён {source}: запись кэша и выходной файл удалены")
+            sys.stdout.flush()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+def percentile(values, q):
+    """Перцентиль по отсортированному списку (ближайший ранг)."""
+    index = max(0, min(len(values) - 1, round(q / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+def print_batch_report(results, elapsed):
+    failed = [result for result in results if not result["ok"]]
+    cached = sum(1 for result in results if result["cached"])
+    print(f"Файлов: {len(results)}, успешно: {len(results) - len(failed)}, из кэша: {cached}, с ошибками: {len(failed)}")
+    if elapsed > 0:
+        print(f"Время: {elapsed:.3f} с, файлов/с: {len(results) / elapsed:.1f}")
+    if results:
+        timings = sorted(result["seconds"] for result in results)
+        percentiles = ", ".join(f"p{q}={percentile(timings, q) * 1000:.3f}" for q in (50, 90, 99))
+        print(f"Время на файл, мс: {percentiles}, max={timings[-1] * 1000:.3f}")
+    for result in failed:
+        position = f":{result['line']}:{result['column']}" if result["line"] is not None else ""
+        first_line = result["message"].splitlines()[0] if result["message"] else ""
+        print(f"{result['source']}{position}: {result['error']}: {first_line}", file=sys.stderr)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Использование: python config_converter.py <выходной_файл.yaml>")
-        sys.exit(1)
-    output_filename = sys.argv[1]
-    input_text = sys.stdin.read()
-    yaml_dict = parse_config(input_text)
-    
-    # Записываем результат в YAML файл
-    with open(output_filename, 'w', encoding='utf-8') as f:
-        yaml.dump(yaml_dict, f, allow_unicode=True, sort_keys=False)
+    arg_parser = argparse.ArgumentParser(description="Преобразование учебного конфигурационного языка из stdin в YAML")
+    arg_parser.add_argument("output", help="Путь к выходному YAML файлу (в пакетном режиме - каталог результатов)")
+    arg_parser.add_argument("--parser", choices=PARSER_MODES, default="inline",
+                            help="Режим разбора: inline (по умолчанию, LALR без дерева разбора), lalr или earley")
+    arg_parser.add_argument("--stream", action="store_true",
+                            help="Читать stdin кусками и писать YAML по мере разбора (для очень больших конфигураций)")
+    arg_parser.add_argument("--batch", metavar="PATTERN",
+                            help="Пакетный режим: каталог или glob-шаблон входных файлов вместо stdin")
+    arg_parser.add_argument("--jobs", type=int, help="Число процессов пакетного режима (по умолчанию число ядер)")
+    arg_parser.add_argument("--report", help="Файл для результатов пакетного режима в формате JSON")
+    arg_parser.add_argument("--cache", metavar="DIR",
+                            help="Каталог кэша пакетного режима: неизменённые файлы не разбираются повторно")
+    arg_parser.add_argument("--watch", action="store_true",
+                            help="Следить за файлами --batch и преобразовывать только изменившиеся")
+    arg_parser.add_argument("--interval", type=float, default=1.0, help="Период опроса файлов в режиме --watch, с")
+    arg_parser.add_argument("--lib", action="append", default=[], metavar="DIR",
+                            help="Каталог поиска модулей констант для import (можно указать несколько раз)")
+    arg_parser.add_argument("--format", choices=list(EMITTERS), default="yaml",
+                            help="Формат вывода: yaml (libyaml, если доступен), yaml-py, json, marshal"
+                                 + (", msgpack" if "msgpack" in EMITTERS else ""))
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="Вывести в stderr время и счётчики каждой стадии (lex, parse, transform, dump)")
+    arg_parser.add_argument("--profile-memory", action="store_true",
+                            help="Как --profile, дополнительно пик памяти стадий (tracemalloc замедляет разбор)")
+    arg_parser.add_argument("--profile-stats", metavar="FILE",
+                            help="Как --profile, дополнительно сохранить профиль cProfile в файл pstats")
+    args = arg_parser.parse_args()
+    output_filename = args.output
+    LIBRARY_PATH.extend(args.lib)
+    if args.watch and args.batch is None:
+        arg_parser.error("--watch требует --batch")
+    if args.batch is not None and (args.profile or args.profile_memory or args.profile_stats):
+        arg_parser.error("профилирование доступно только для одного документа, без --batch")
+    if args.stream and args.format not in ("yaml", "yaml-py"):
+        arg_parser.error("--stream поддерживает только форматы yaml и yaml-py")
+    if args.batch is not None:
+        cache = None
+        if args.cache is not None or args.watch:
+            cache = ConversionCache(args.cache or os.path.join(output_filename, ".cache"), cache_fingerprint(args.format))
+        if args.watch:
+            watch(args.batch, output_filename, cache, args.jobs, args.parser, args.interval, args.format)
+            sys.exit()
+        results, elapsed = batch_convert(args.batch, output_filename, args.jobs, args.parser, cache, args.format)
+        print_batch_report(results, elapsed)
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump({"elapsed": elapsed, "results": results}, f, ensure_ascii=False, indent=2)
+        sys.exit(1 if any(not result["ok"] for result in results) else 0)
+    profile = None
+    if args.profile or args.profile_memory or args.profile_stats:
+        profile = PipelineProfile(memory=args.profile_memory, stats_path=args.profile_stats).start()
+    if args.stream:
+        dumper_class = yaml.Dumper if args.format == "yaml-py" else YamlDumper
+        with open(output_filename, 'w', encoding='utf-8') as f:
+            if profile is None:
+                error = stream_config(sys.stdin, f, dumper_class=dumper_class)
+            else:
+                # В потоковом режиме разбор, преобразование и вывод совмещены
+                with profile.stage("stream") as record:
+                    error = stream_config(sys.stdin, f, dumper_class=dumper_class)
+                record["bytes"] = f.tell()
+            if error is not None:
+                # Частично записанный документ заменяется сообщением об ошибке, как в обычном режиме
+                f.seek(0)
+                f.truncate()
+                EMITTERS[args.format][2](error, f)
+    else:
+        input_text = sys.stdin.read()
+        yaml_dict = parse_config(input_text, args.parser, profile=profile)
+
+        # Записываем результат в файл выбранного формата
+        if profile is None:
+            write_output(yaml_dict, output_filename, args.format)
+        else:
+            with profile.stage("dump") as record:
+                write_output(yaml_dict, output_filename, args.format)
+            record["bytes"] = os.path.getsize(output_filename)
+    if profile is not None:
+        profile.stop()
+        print(profile.report(), file=sys.stderr)
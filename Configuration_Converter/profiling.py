@@ -0,0 +1,74 @@
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class PipelineProfile:
+    """
+    Замеры стадий преобразования. Каждая стадия - запись в stages: имя, время,
+    пик памяти (если memory) и счётчики, которые стадия добавляет в запись.
+    stats_path - файл pstats, в который сохраняется cProfile всего прогона.
+    """
+    def __init__(self, memory=False, stats_path=None):
+        self.memory = memory
+        self.stats_path = stats_path
+        self.stages = []
+        self._profiler = None
+        self._tracing = False
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        if self.stats_path is not None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.stats_path)
+            self._profiler = None
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextmanager
+    def stage(self, name):
+        """Замер стадии; счётчики записываются в выдаваемый словарь (и после выхода из блока)."""
+        record = {"stage": name, "seconds": None, "peak": None}
+        memory = self.memory and tracemalloc.is_tracing()
+        if memory:
+            # Пик считается от памяти, занятой к началу стадии
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = perf_counter() - start
+            if memory:
+                record["peak"] = tracemalloc.get_traced_memory()[1] - base
+            self.stages.append(record)
+
+    def report(self):
+        """Таблица стадий для вывода в stderr."""
+        lines = [f"{'Стадия':<16} {'Время, мс':>10} {'Пик, МиБ':>9}  Счётчики"]
+        for record in self.stages:
+            peak = "-" if record["peak"] is None else f"{record['peak'] / 1024 / 1024:.2f}"
+            counts = ", ".join(f"{key}={value}" for key, value in record.items()
+                               if key not in ("stage", "seconds", "peak"))
+            lines.append(f"{record['stage']:<16} {record['seconds'] * 1000:>10.3f} {peak:>9}  {counts}")
+        total = sum(record["seconds"] for record in self.stages)
+        lines.append(f"{'итого':<16} {total * 1000:>10.3f}")
+        if self.stats_path is not None:
+            lines.append(f"Профиль cProfile: {self.stats_path} (python -m pstats {self.stats_path})")
+        return "\n".join(lines)
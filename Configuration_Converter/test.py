@@ -1,5 +1,16 @@
+import io
+import os
 import pytest
-from main import parse_config
+import yaml
+from lark import exceptions
+from cache import ConversionCache
+from profiling import PipelineProfile
+import json
+import marshal
+import pstats
+import main
+from main import (parse_config, load_config, stream_config, batch_convert, watch_step, cache_fingerprint,
+                  write_output, load_module, EMITTERS, PARSER_MODES)
 
 def test_simple_config():
     input_text = '''root {
@@ -94,3 +105,281 @@ def test_duplicate_constant_error():
     }'''
     result = parse_config(input_text)
     assert "Константа x уже объявлена" in result
+
+@pytest.mark.parametrize("mode", PARSER_MODES)
+def test_parser_modes_agree(mode):
+    input_text = '''***> Комментарий
+    set base = 5
+    root {
+        empty = #(),
+        nested = #(1 #(2 [[два]]) $chr(67)$),
+        calc = $+ base 3$
+    }'''
+    expected_output = {'root': {'empty': [], 'nested': [1, [2, 'два'], 'C'], 'calc': 8}}
+    assert parse_config(input_text, mode) == expected_output
+
+@pytest.mark.parametrize("mode", PARSER_MODES)
+def test_parser_modes_syntax_error(mode):
+    result = parse_config('''root { value = }''', mode)
+    assert "Ошибка в синтаксисе" in result
+
+EVALUATION_ERRORS = [
+    ('root { a = $mod(5, 0)$ }', "Деление на ноль"),
+    ('root { a = $chr(99999999999999999999)$ }', "Аргумент chr вне диапазона"),
+]
+
+@pytest.mark.parametrize("input_text, message", EVALUATION_ERRORS)
+@pytest.mark.parametrize("mode", PARSER_MODES + ("stream",))
+def test_evaluation_errors(mode, input_text, message):
+    if mode == "stream":
+        result = stream_config(io.StringIO(input_text), io.StringIO())
+    else:
+        result = parse_config(input_text, mode)
+    assert "Ошибка при обработке" in result and message in result
+
+def test_inline_constants_reset():
+    first = parse_config('''set x = 1
+    root { value = $+ x 1$ }''', "inline")
+    second = parse_config('''set x = 2
+    root { value = $+ x 1$ }''', "inline")
+    assert first == {'root': {'value': 2}}
+    assert second == {'root': {'value': 3}}
+    assert type(next(iter(second['root']))) is str
+
+@pytest.mark.parametrize("dumper_class", [yaml.Dumper, getattr(yaml, "CDumper", yaml.Dumper)])
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 16])
+def test_stream_matches_dump(chunk_size, dumper_class):
+    input_text = '''***> Комментарий
+    set base = 5
+    set pair = #(1 [[x]])
+    root {
+        empty = #(),
+        nested = #(1 #(2 [[два]] #()) $chr(67)$),
+        calc = $+ base 3$,
+        text = [[Привет,
+мир]]
+    }'''
+    output = io.StringIO()
+    assert stream_config(io.StringIO(input_text), output, chunk_size, dumper_class) is None
+    assert output.getvalue() == yaml.dump(parse_config(input_text), Dumper=dumper_class, allow_unicode=True,
+                                          sort_keys=False)
+
+def test_stream_errors():
+    assert "Ошибка в синтаксисе" in stream_config(io.StringIO('''root { a = 1 b = 2 }'''), io.StringIO(), 4)
+    assert "Неизвестная константа" in stream_config(io.StringIO('''root { a = $+ q 1$ }'''), io.StringIO())
+
+def test_load_config_raises():
+    with pytest.raises(exceptions.UnexpectedInput):
+        load_config('''root { value = }''')
+    with pytest.raises(ValueError):
+        load_config('''root { value = $+ x 1$ }''')
+
+def test_batch_convert(tmp_path):
+    source_dir = tmp_path / "configs"
+    (source_dir / "nested").mkdir(parents=True)
+    (source_dir / "first.txt").write_text("set x = 1\nroot { value = $+ x 1$ }", encoding="utf-8")
+    (source_dir / "nested" / "second.txt").write_text("root { text = [[Привет]] }", encoding="utf-8")
+    (source_dir / "broken.txt").write_text("root {\n value = }", encoding="utf-8")
+    output_dir = tmp_path / "yaml"
+    results, elapsed = batch_convert(str(source_dir / "**" / "*.txt"), str(output_dir), jobs=2)
+    by_name = {os.path.basename(result["source"]): result for result in results}
+    assert len(results) == 3
+    assert [result["source"] for result in results] == sorted(result["source"] for result in results)
+    assert by_name["first.txt"]["ok"]
+    assert yaml.safe_load((output_dir / "first.yaml").read_text(encoding="utf-8")) == {'root': {'value': 2}}
+    assert yaml.safe_load((output_dir / "nested" / "second.yaml").read_text(encoding="utf-8")) == {'root': {'text': 'Привет'}}
+    broken = by_name["broken.txt"]
+    assert not broken["ok"] and broken["error"] == "syntax"
+    assert (broken["line"], broken["column"]) == (2, 10)
+    assert not (output_dir / "broken.yaml").exists()
+    assert all(result["seconds"] >= 0 for result in results)
+
+def test_batch_failing_files(tmp_path):
+    source_dir = tmp_path / "configs"
+    source_dir.mkdir()
+    (source_dir / "good.conf").write_text("root { a = 1 }", encoding="utf-8")
+    (source_dir / "zero.conf").write_text("root { a = $mod(1, 0)$ }", encoding="utf-8")
+    # Вложенность сверх предела рекурсии yaml.dump - непредвиденное исключение при записи
+    (source_dir / "deep.conf").write_text("root { a = " + "#(" * 3000 + ")" * 3000 + " }", encoding="utf-8")
+    output_dir = tmp_path / "out"
+    results, _ = batch_convert(str(source_dir / "*.conf"), str(output_dir), jobs=2)
+    by_name = {os.path.basename(result["source"]): result for result in results}
+    assert by_name["good.conf"]["ok"]
+    assert yaml.safe_load((output_dir / "good.yaml").read_text(encoding="utf-8")) == {'root': {'a': 1}}
+    assert by_name["zero.conf"]["error"] == "processing"
+    assert by_name["deep.conf"]["error"] == "internal"
+    assert by_name["deep.conf"]["message"].startswith("RecursionError")
+    assert sorted(os.listdir(output_dir)) == ["good.yaml"]
+
+def test_batch_cache(tmp_path):
+    source_dir = tmp_path / "configs"
+    source_dir.mkdir()
+    for name, number in (("first", 1), ("second", 2)):
+        (source_dir / f"{name}.txt").write_text(f"root {{ value = {number} }}", encoding="utf-8")
+    output_dir = tmp_path / "yaml"
+    cache = ConversionCache(str(tmp_path / "cache"), cache_fingerprint())
+    results, _ = batch_convert(str(source_dir), str(output_dir), jobs=1, cache=cache)
+    assert [result["cached"] for result in results] == [False, False]
+    (source_dir / "second.txt").write_text("root { value = 3 }", encoding="utf-8")
+    cache = ConversionCache(str(tmp_path / "cache"), cache_fingerprint())
+    results, _ = batch_convert(str(source_dir), str(output_dir), jobs=1, cache=cache)
+    assert [result["cached"] for result in results] == [True, False]
+    assert yaml.safe_load((output_dir / "second.yaml").read_text(encoding="utf-8")) == {'root': {'value': 3}}
+    assert len(os.listdir(tmp_path / "cache" / "objects")) == 2
+    stale = ConversionCache(str(tmp_path / "cache"), "другая версия грамматики")
+    assert stale.entries == {} and os.listdir(tmp_path / "cache" / "objects") == []
+
+def test_watch_step(tmp_path):
+    source_dir = tmp_path / "configs"
+    source_dir.mkdir()
+    source = source_dir / "service.txt"
+    source.write_text("root { port = 80 }", encoding="utf-8")
+    output_dir = tmp_path / "yaml"
+    cache = ConversionCache(str(tmp_path / "cache"), cache_fingerprint())
+    state = {}
+    results, deleted = watch_step(str(source_dir / "*.txt"), str(output_dir), cache, state, jobs=1)
+    assert [result["ok"] for result in results] == [True] and deleted == []
+    assert watch_step(str(source_dir / "*.txt"), str(output_dir), cache, state, jobs=1) == ([], [])
+    source.write_text("root { port = 8080 }", encoding="utf-8")
+    os.utime(source, ns=(0, 1))
+    results, _ = watch_step(str(source_dir / "*.txt"), str(output_dir), cache, state, jobs=1)
+    assert len(results) == 1 and not results[0]["cached"]
+    assert yaml.safe_load((output_dir / "service.yaml").read_text(encoding="utf-8")) == {'root': {'port': 8080}}
+    source.unlink()
+    results, deleted = watch_step(str(source_dir / "*.txt"), str(output_dir), cache, state, jobs=1)
+    assert results == [] and deleted == [str(source)]
+    assert not (output_dir / "service.yaml").exists()
+    assert cache.entries == {} and os.listdir(tmp_path / "cache" / "objects") == []
+
+@pytest.mark.parametrize("emitter", list(EMITTERS))
+def test_emitters(tmp_path, emitter):
+    data = parse_config('''set base = 5
+    root {
+        nested = #(1 #(2 [[два]] #()) $chr(67)$),
+        calc = $+ base 3$,
+        text = [[Привет, мир]]
+    }''')
+    path = tmp_path / f"out{EMITTERS[emitter][0]}"
+    write_output(data, str(path), emitter)
+    if emitter.startswith("yaml"):
+        assert path.read_text(encoding="utf-8") == yaml.dump(data, allow_unicode=True, sort_keys=False)
+    elif emitter == "json":
+        assert json.loads(path.read_text(encoding="utf-8")) == data
+    elif emitter == "marshal":
+        assert marshal.loads(path.read_bytes()) == data
+    else:
+        import msgpack
+        assert msgpack.unpackb(path.read_bytes()) == data
+
+@pytest.fixture
+def constant_modules(tmp_path):
+    (tmp_path / "net.consts").write_text('''***> Общие константы
+    set PORT = 8000
+    set BASE = $+ PORT 80$
+    set LETTER = $chr(65)$''', encoding="utf-8")
+    (tmp_path / "other.consts").write_text("set PORT = 1", encoding="utf-8")
+    return tmp_path
+
+@pytest.mark.parametrize("mode", PARSER_MODES)
+def test_import_constants(constant_modules, mode):
+    input_text = '''import [[net.consts]]
+    set LOCAL = $+ BASE 1$
+    root { port = $+ BASE 0$, local = $+ LOCAL 0$ }'''
+    assert parse_config(input_text, mode, str(constant_modules)) == {'root': {'port': 8080, 'local': 8081}}
+
+def test_import_stream(constant_modules):
+    output = io.StringIO()
+    assert stream_config(io.StringIO("import [[net.consts]] root { port = $+ BASE 1$ }"), output,
+                         base_dir=str(constant_modules)) is None
+    assert yaml.safe_load(output.getvalue()) == {'root': {'port': 8081}}
+
+def test_module_cache(constant_modules):
+    path = str(constant_modules / "net.consts")
+    module = load_module(path)
+    assert dict(module) == {'PORT': 8000, 'BASE': 8080, 'LETTER': 'A'}
+    assert load_module(path) is module
+    with pytest.raises(TypeError):
+        module['PORT'] = 1
+    assert (constant_modules / "net.consts.constants").exists()
+    del main._modules[path]
+    assert dict(load_module(path)) == dict(module)
+
+def test_import_redefinition(constant_modules):
+    base_dir = str(constant_modules)
+    result = parse_config("import [[net.consts]] import [[other.consts]] root { a = 1 }", base_dir=base_dir)
+    assert "Константа PORT из модуля" in result and "net.consts" in result
+    result = parse_config("import [[net.consts]] set BASE = 1 root { a = 1 }", base_dir=base_dir)
+    assert "Константа BASE уже объявлена в модуле" in result
+    assert "Модуль констант missing.consts не найден" in parse_config("import [[missing.consts]] root { a = 1 }",
+                                                                      base_dir=base_dir)
+
+def test_watch_module_change(constant_modules, tmp_path):
+    source_dir = tmp_path / "configs"
+    source_dir.mkdir()
+    (source_dir / "service.txt").write_text("import [[../net.consts]] root { port = $+ PORT 0$ }", encoding="utf-8")
+    output_dir = tmp_path / "yaml"
+    cache = ConversionCache(str(tmp_path / "cache"), cache_fingerprint())
+    state = {}
+    results, _ = watch_step(str(source_dir / "*.txt"), str(output_dir), cache, state, jobs=1)
+    assert results[0]["ok"]
+    module = constant_modules / "net.consts"
+    module.write_text("set PORT = 9000", encoding="utf-8")
+    os.utime(module, ns=(0, 1))
+    results, _ = watch_step(str(source_dir / "*.txt"), str(output_dir), cache, state, jobs=1)
+    assert len(results) == 1 and not results[0]["cached"]
+    assert yaml.safe_load((output_dir / "service.yaml").read_text(encoding="utf-8")) == {'root': {'port': 9000}}
+
+def test_watch_module_created(tmp_path):
+    source_dir = tmp_path / "configs"
+    source_dir.mkdir()
+    (source_dir / "service.txt").write_text("import [[net.consts]] root { port = $+ PORT 0$ }", encoding="utf-8")
+    output_dir = tmp_path / "yaml"
+    cache = ConversionCache(str(tmp_path / "cache"), cache_fingerprint())
+    state = {}
+    results, _ = watch_step(str(source_dir / "*.txt"), str(output_dir), cache, state, jobs=1)
+    assert not results[0]["ok"]
+    results, _ = watch_step(str(source_dir / "*.txt"), str(output_dir), cache, state, jobs=1)
+    assert results == []
+    (source_dir / "net.consts").write_text("set PORT = 9000", encoding="utf-8")
+    results, _ = watch_step(str(source_dir / "*.txt"), str(output_dir), cache, state, jobs=1)
+    assert len(results) == 1 and results[0]["ok"]
+    assert yaml.safe_load((output_dir / "service.yaml").read_text(encoding="utf-8")) == {'root': {'port': 9000}}
+
+@pytest.mark.parametrize("mode, stages", [
+    ("inline", ["lex", "parse+transform"]),
+    ("lalr", ["lex", "parse", "transform"]),
+    ("earley", ["lex", "parse", "transform"]),
+])
+def test_profile_stages(mode, stages):
+    input_text = "set a = 1 root { b = $+ a 1$, c = #(1 [[x]]) }"
+    with PipelineProfile(memory=True) as profile:
+        assert parse_config(input_text, mode, profile=profile) == parse_config(input_text, mode)
+    assert [record["stage"] for record in profile.stages] == stages
+    assert profile.stages[0]["tokens"] == 21
+    assert profile.stages[-1]["values"] == 6
+    assert all(record["seconds"] >= 0 and record["peak"] >= 0 for record in profile.stages)
+    assert "итого" in profile.report()
+
+def test_profile_stats(tmp_path):
+    stats_path = str(tmp_path / "run.pstats")
+    with PipelineProfile(stats_path=stats_path) as profile:
+        parse_config("root { a = 1 }", profile=profile)
+    assert profile.stages[0]["peak"] is None
+    assert any(function[2] == "load_config" for function in pstats.Stats(stats_path).stats)
+
+def test_batch_cache_second_import(constant_modules, tmp_path):
+    source_dir = tmp_path / "configs"
+    source_dir.mkdir()
+    (tmp_path / "extra.consts").write_text("set EXTRA = 1", encoding="utf-8")
+    (source_dir / "service.txt").write_text(
+        "import [[../net.consts]] import [[../extra.consts]] root { port = $+ EXTRA 0$ }", encoding="utf-8")
+    output_dir = tmp_path / "yaml"
+    cache = ConversionCache(str(tmp_path / "cache"), cache_fingerprint())
+    results, _ = batch_convert(str(source_dir / "*.txt"), str(output_dir), jobs=1, cache=cache)
+    assert len(results[0]["modules"]) == 2
+    module = tmp_path / "extra.consts"
+    module.write_text("set EXTRA = 2", encoding="utf-8")
+    os.utime(module, ns=(0, 1))
+    results, _ = batch_convert(str(source_dir / "*.txt"), str(output_dir), jobs=1, cache=cache)
+    assert not results[0]["cached"]
+    assert yaml.safe_load((output_dir / "service.yaml").read_text(encoding="utf-8")) == {'root': {'port': 2}}
@@ -0,0 +1,202 @@
+import argparse
+import gzip
+import json
+import os
+import tempfile
+import threading
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import perf_counter, sleep
+
+from cache import MetadataCache
+from http_pool import ConnectionPool
+from graph import DependencyGraph
+from main import get_dependencies, resolve_dependencies, generate_plantuml_graph
+
+
+def generate_registry(packages, levels=10, fanout=4):
+    """
+    Синтетический репозиторий: пакеты разбиты на уровни, пакет уровня L зависит
+    от fanout пакетов уровня L + 1, корень - от всех пакетов первого уровня.
+    Глубина графа равна числу уровней, поэтому рекурсия get_dependencies неглубокая.
+    Возвращает (package.json корня, словарь name@version -> package.json).
+    """
+    width = max(1, packages // levels)
+    registry = {}
+    for level in range(levels):
+        for k in range(width):
+            dependencies = {}
+            if level + 1 < levels:
+                for j in range(fanout):
+                    dependencies[f"pkg-{level + 1}-{(k + j * j * 7) % width}"] = "^1.0.0"
+            registry[f"pkg-{level}-{k}@1.0.0"] = {"name": f"pkg-{level}-{k}", "version": "1.0.0",
+                                                 "dependencies": dependencies}
+    root = {"name": "root", "version": "1.0.0", "dependencies": {f"pkg-0-{k}": "^1.0.0" for k in range(width)}}
+    return root, registry
+
+
+def serve_registry(registry, latency):
+    """Локальный HTTP репозиторий: GET /имя/версия отдаёт package.json из словаря."""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Заголовки и тело пишутся отдельно: без TCP_NODELAY каждый ответ
+        # в постоянном соединении ждал бы отложенного подтверждения клиента
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if latency:
+                sleep(latency)
+            name, _, version = self.path.strip("/").rpartition("/")
+            package = registry.get(f"{name}@{version}")
+            if package is None:
+                self.send_error(404)
+                return
+            body = json.dumps(package).encode()
+            self.send_response(200)
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # Очередь подключений как у настоящего сервера: при очереди по умолчанию (5)
+        # одновременные подключения теряются и повторяются через секунду
+        request_queue_size = 128
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def synthetic_rows(nodes, edges):
+    """Строки графа как у обходчиков: имена зависимостей каждый раз форматируются заново."""
+    fanout = max(1, edges // nodes)
+    for i in range(nodes):
+        yield f"pkg-{i}@1.0.0", [f"pkg-{(i * 31 + j * j * 7 + 1) % nodes}@1.0.0" for j in range(fanout)]
+
+
+def build_graph(nodes, edges):
+    graph = DependencyGraph()
+    for name, dependencies in synthetic_rows(nodes, edges):
+        graph.add(name, dependencies)
+    return graph
+
+
+def bench_graph(nodes, edges):
+    """Память и время: словарь списков строк против DependencyGraph на одном и том же графе."""
+    print(f"Граф: {nodes} узлов, {nodes * max(1, edges // nodes)} рёбер")
+    for label, build in (("словарь списков", lambda: dict(synthetic_rows(nodes, edges))),
+                         ("DependencyGraph", lambda: build_graph(nodes, edges))):
+        # Память измеряется отдельным построением: трассировка замедляет работу
+        start = perf_counter()
+        graph = build()
+        elapsed = perf_counter() - start
+        del graph
+        tracemalloc.start()
+        try:
+            graph = build()
+            size, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        start = perf_counter()
+        plantuml = generate_plantuml_graph(graph)
+        plantuml_seconds = perf_counter() - start
+        print(f"  {label:<16} построение {elapsed:7.3f} с, занято {size / 1024 / 1024:7.1f} МиБ, "
+              f"пик {peak / 1024 / 1024:7.1f} МиБ, PlantUML {plantuml_seconds:6.3f} с, {len(plantuml) / 1024 / 1024:.1f} МиБ")
+        del graph, plantuml
+
+
+def measure(action):
+    start = perf_counter()
+    result = action()
+    elapsed = perf_counter() - start
+    tracemalloc.start()
+    try:
+        action()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разрешения зависимостей на синтетическом графе")
+    parser.add_argument("--packages", type=int, default=5000, help="Число пакетов в синтетическом репозитории")
+    parser.add_argument("--levels", type=int, default=10, help="Число уровней (глубина) графа")
+    parser.add_argument("--fanout", type=int, default=4, help="Число зависимостей каждого пакета")
+    parser.add_argument("--jobs", type=int, default=16, help="Число потоков обхода в ширину")
+    parser.add_argument("--http", action="store_true",
+                        help="Загружать пакеты с локального HTTP репозитория, а не из кэша в режиме offline")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа HTTP репозитория, с")
+    parser.add_argument("--no-compress", action="store_true", help="Не запрашивать ответы в gzip (для пула)")
+    parser.add_argument("--graph", action="store_true",
+                        help="Сравнить только представления графа: словарь списков и DependencyGraph")
+    parser.add_argument("--nodes", type=int, default=100000, help="Число узлов графа для --graph")
+    parser.add_argument("--edges", type=int, default=1000000, help="Число рёбер графа для --graph")
+    args = parser.parse_args()
+    if args.graph:
+        bench_graph(args.nodes, args.edges)
+        return
+
+    root, registry = generate_registry(args.packages, args.levels, args.fanout)
+    with tempfile.TemporaryDirectory() as work_dir:
+        root_path = os.path.join(work_dir, "package.json")
+        with open(root_path, "w") as f:
+            json.dump(root, f)
+        cache_path = os.path.join(work_dir, "metadata.sqlite")
+        with MetadataCache(cache_path) as cache:
+            for package_id, package in registry.items():
+                cache.put(package_id, package)
+
+        server = None
+        url = "http://127.0.0.1:1/"
+        if args.http:
+            server = serve_registry(registry, args.latency)
+            url = f"http://127.0.0.1:{server.server_port}/"
+        print(f"Пакетов: {len(registry)}, уровней: {args.levels}, зависимостей у пакета: {args.fanout}, "
+              f"источник: {'HTTP' if args.http else 'кэш (offline)'}")
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            variants = [("обход в глубину", 1, False), (f"в ширину, {args.jobs} потоков", args.jobs, False)]
+            if args.http:
+                variants += [("в глубину, пул", 1, True), (f"в ширину, {args.jobs} потоков, пул", args.jobs, True)]
+            for label, jobs, pooled in variants:
+                pools = []
+
+                def action():
+                    cache = None if args.http else MetadataCache(cache_path, offline=True)
+                    pool = ConnectionPool(jobs, compress=not args.no_compress) if pooled else None
+                    pools.append(pool)
+                    try:
+                        if jobs == 1:
+                            return get_dependencies(root_path, url, cache=cache, pool=pool)
+                        return resolve_dependencies(root_path, url, jobs, cache, pool)[0]
+                    finally:
+                        if cache is not None:
+                            cache.close()
+                        if pool is not None:
+                            pool.close()
+
+                elapsed, peak, dependencies = measure(action)
+                edges = sum(len(deps) for deps in dependencies.values())
+                print(f"  {label:<30} {elapsed:8.3f} с, пик {peak / 1024 / 1024:7.1f} МиБ, "
+                      f"пакетов {len(dependencies)}, рёбер {edges}")
+                if pooled:
+                    stats = pools[0].stats
+                    print(f"    соединений {stats['connections']}, повторно {pools[0].reuse_ratio():.1%}, "
+                          f"получено {stats['bytes_received'] / 1024:.1f} КиБ из {stats['bytes_decoded'] / 1024:.1f} КиБ")
+        finally:
+            os.chdir(cwd)
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+
+if __name__ == "__main__":
+    main()
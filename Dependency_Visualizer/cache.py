@@ -0,0 +1,90 @@
+import os
+import re
+import json
+import sqlite3
+import time
+
+# Точная версия semver: опубликованный package.json такой версии не меняется
+EXACT_VERSION = re.compile(r"^\d+\.\d+\.\d+(?:[-+][0-9A-Za-z.+-]+)?$")
+
+
+def is_immutable(package_id):
+    """name@version с точной версией; диапазоны и теги (latest, 1.x, *) могут указывать на новые версии."""
+    return EXACT_VERSION.match(package_id.rpartition("@")[2]) is not None
+
+
+class MetadataCache:
+    """
+    Постоянный кэш метаданных пакетов в SQLite, ключ - name@version запроса.
+    Хранятся только поля, нужные для построения графа: name, version, dependencies.
+    Записи точных версий не устаревают, записи диапазонов и тегов действуют ttl секунд.
+    max_entries ограничивает размер: при save удаляются давно не использованные записи.
+    offline - разрешение зависимостей только из кэша, включая устаревшие записи.
+    Соединение SQLite используется только из потока, создавшего кэш.
+    """
+    def __init__(self, path, ttl=24 * 60 * 60, max_entries=None, offline=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS packages ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, immutable INTEGER NOT NULL, "
+            "fetched REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS packages_accessed ON packages (accessed)")
+
+    def get(self, package_id):
+        """Метаданные пакета или None, если записи нет или она устарела (вне offline)."""
+        row = self.connection.execute(
+            "SELECT data, immutable, fetched FROM packages WHERE id = ?", (package_id,)
+        ).fetchone()
+        now = time.time()
+        if row is None or not (row[1] or self.offline or self.ttl is None or now - row[2] <= self.ttl):
+            self.misses += 1
+            return None
+        self.connection.execute("UPDATE packages SET accessed = ? WHERE id = ?", (now, package_id))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, package_id, package_data):
+        data = {key: package_data[key] for key in ("name", "version", "dependencies") if key in package_data}
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?)",
+            (package_id, json.dumps(data, separators=(",", ":")), is_immutable(package_id), now, now),
+        )
+
+    def prune(self):
+        """Удаление устаревших записей диапазонов и тегов и лишних записей сверх max_entries."""
+        if self.ttl is not None:
+            self.connection.execute("DELETE FROM packages WHERE immutable = 0 AND fetched < ?",
+                                    (time.time() - self.ttl,))
+        if self.max_entries is not None:
+            self.connection.execute(
+                "DELETE FROM packages WHERE id NOT IN "
+                "(SELECT id FROM packages ORDER BY accessed DESC LIMIT ?)", (self.max_entries,)
+            )
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM packages").fetchone()[0]
+
+    def save(self):
+        if not self.offline:
+            self.prune()
+        self.connection.commit()
+
+    def close(self):
+        self.save()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,89 @@
+import sys
+from array import array
+
+
+class DependencyGraph:
+    """
+    Компактный граф зависимостей. Имена пакетов (name@version) интернируются
+    и заменяются номерами узлов, списки зависимостей хранятся подряд в одном
+    массиве (CSR): зависимости строки row - targets[offsets[row]:offsets[row + 1]].
+    Повторные зависимости отбрасываются при добавлении строки за O(1) на ребро.
+    Порядок пакетов и зависимостей совпадает с порядком добавления, items()
+    возвращает то же, что словарь dependencies, поэтому граф можно передавать
+    в generate_plantuml_graph; to_dict и from_dict переводят граф в словарь и обратно.
+    """
+    def __init__(self):
+        self.names = []             # номер узла -> имя пакета
+        self.index = {}             # имя пакета -> номер узла
+        self.row_of = array("i")    # номер узла -> номер строки или -1, если зависимости не добавлены
+        self.rows = array("i")      # номер строки -> номер узла
+        self.offsets = array("q", [0])
+        self.targets = array("i")
+
+    def node(self, name):
+        """Номер узла для имени; новое имя интернируется."""
+        node_id = self.index.get(name)
+        if node_id is None:
+            node_id = len(self.names)
+            name = sys.intern(name)
+            self.names.append(name)
+            self.index[name] = node_id
+            self.row_of.append(-1)
+        return node_id
+
+    def add(self, name, dependencies):
+        """Добавление пакета со списком зависимостей (повторы отбрасываются)."""
+        source = self.node(name)
+        if self.row_of[source] != -1:
+            raise ValueError(f"Зависимости пакета {name} уже добавлены")
+        self.row_of[source] = len(self.rows)
+        self.rows.append(source)
+        index = self.index
+        row = []
+        for dependency in dependencies:
+            target = index.get(dependency)
+            row.append(self.node(dependency) if target is None else target)
+        # dict.fromkeys убирает повторы с сохранением порядка
+        self.targets.extend(dict.fromkeys(row))
+        self.offsets.append(len(self.targets))
+
+    def successors(self, node_id):
+        """Номера узлов зависимостей пакета с номером node_id."""
+        row = self.row_of[node_id]
+        if row == -1:
+            raise KeyError(self.names[node_id])
+        return self.targets[self.offsets[row]:self.offsets[row + 1]]
+
+    def __getitem__(self, name):
+        names = self.names
+        return [names[target] for target in self.successors(self.index[name])]
+
+    def __contains__(self, name):
+        node_id = self.index.get(name)
+        return node_id is not None and self.row_of[node_id] != -1
+
+    def __iter__(self):
+        names = self.names
+        for source in self.rows:
+            yield names[source]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def edge_count(self):
+        return len(self.targets)
+
+    def items(self):
+        names, offsets, targets = self.names, self.offsets, self.targets
+        for row, source in enumerate(self.rows):
+            yield names[source], [names[target] for target in targets[offsets[row]:offsets[row + 1]]]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    @classmethod
+    def from_dict(cls, dependencies):
+        graph = cls()
+        for name, package_dependencies in dependencies.items():
+            graph.add(name, package_dependencies)
+        return graph
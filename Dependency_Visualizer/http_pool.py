@@ -0,0 +1,106 @@
+import gzip
+import threading
+import http.client
+import urllib.error
+import urllib.parse
+
+REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class ConnectionPool:
+    """
+    Пул постоянных соединений HTTP/1.1 (keep-alive) к хостам репозитория.
+    Соединение берётся из пула на время одного запроса, поэтому пул можно
+    использовать из нескольких потоков; свободных соединений на хост хранится
+    не больше max_connections. compress - запрашивать ответы в gzip.
+    Конвейерная передача запросов (pipelining) и мультиплексирование HTTP/2
+    стандартной библиотекой не поддерживаются, параллельность достигается
+    несколькими соединениями.
+    stats: запросы, открытые и повторно использованные соединения,
+    байты, полученные по сети, и байты после распаковки.
+    """
+    def __init__(self, max_connections=16, timeout=30, compress=True):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.compress = compress
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "reused": 0, "bytes_received": 0, "bytes_decoded": 0}
+
+    def _count(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self.stats[key] += value
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        self._count(connections=1)
+        return connection_class(host, port, timeout=self.timeout), False
+
+    def _release(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_connections:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _request(self, key, path, headers):
+        # Сервер мог закрыть простаивавшее соединение - тогда запрос повторяется по новому
+        while True:
+            connection, reused = self._acquire(key)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(key, connection)
+            self._count(requests=1, reused=int(reused), bytes_received=len(body))
+            return response, body
+
+    def get(self, url, redirects=5):
+        """Тело ответа на GET запрос; статус 4xx и 5xx - urllib.error.HTTPError, как у urlopen."""
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        headers = {"Accept": "application/json", "Accept-Encoding": "gzip" if self.compress else "identity"}
+        response, body = self._request(key, path, headers)
+        if response.status in REDIRECTS and response.getheader("Location") and redirects > 0:
+            return self.get(urllib.parse.urljoin(url, response.getheader("Location")), redirects - 1)
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+        if response.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self._count(bytes_decoded=len(body))
+        return body
+
+    def reuse_ratio(self):
+        return self.stats["reused"] / self.stats["requests"] if self.stats["requests"] else 0.0
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
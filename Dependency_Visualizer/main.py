@@ -1,60 +1,213 @@
 import os
 import sys
 import json
+import argparse
 import urllib.request
 import subprocess
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
 
-def get_dependencies(package_path, repository_url, dependencies=None, visited=None):
+from cache import MetadataCache
+from http_pool import ConnectionPool
+from graph import DependencyGraph
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "dependency_visualizer", "metadata.sqlite")
+
+def cached_package(cache, dep_id):
+    """Метаданные пакета из кэша или None; в режиме offline отсутствие записи - ошибка загрузки."""
+    if cache is None:
+        return None
+    package_data = cache.get(dep_id)
+    if package_data is None and cache.offline:
+        raise LookupError(f"пакета {dep_id} нет в кэше (режим offline)")
+    return package_data
+
+def download(url, pool=None):
+    """Тело ответа репозитория: через пул постоянных соединений или отдельным urlopen."""
+    if pool is not None:
+        return pool.get(url)
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+def get_dependencies(package_path, repository_url, dependencies=None, visited=None, cache=None, pool=None):
+    with open(package_path, 'r') as file:
+        package_data = json.load(file)
+
+    return collect_dependencies(package_data, repository_url, dependencies, visited, cache, pool)
+
+def collect_dependencies(package_data, repository_url, dependencies=None, visited=None, cache=None, pool=None):
+    """
+    Рекурсивный обход зависимостей в глубину от уже разобранного package.json:
+    метаданные зависимостей передаются в рекурсию в памяти, без временных файлов.
+    """
     if dependencies is None:
         dependencies = {}
     if visited is None:
         visited = set()
 
-    with open(package_path, 'r') as file:
-        package_data = json.load(file)
-        
-        package_name = package_data.get('name', '')
-        package_version = package_data.get('version', '')
-        package_id = f"{package_name}@{package_version}"
-        
+    package_name = package_data.get('name', '')
+    package_version = package_data.get('version', '')
+    package_id = f"{package_name}@{package_version}"
+
+    deps = package_data.get('dependencies', {})
+
+    # Разные версии зависимости (1 и 1.0) могут указывать на один пакет:
+    # список уже обойдённого пакета не сбрасывается, как и в resolve_dependencies
+    if package_id not in visited:
+        visited.add(package_id)
         dependencies[package_id] = []
+        listed = set()
 
-        deps = package_data.get('dependencies', {})
-        
-        if package_id not in visited:
-            visited.add(package_id)
-
-            for dep_name, dep_version in deps.items():
-                clean_version = dep_version.replace('^', '').replace('~', '')
-                dep_id = f"{dep_name}@{clean_version}"
-                
-                if dep_id not in dependencies[package_id]:
-                    dependencies[package_id].append(dep_id)
-
-                if dep_id not in visited:
-                    temp_dir = f"temp_{dep_name}"
-                    os.makedirs(temp_dir, exist_ok=True)
-                    
-                    try:
+        for dep_name, dep_version in deps.items():
+            clean_version = dep_version.replace('^', '').replace('~', '')
+            dep_id = f"{dep_name}@{clean_version}"
+
+            if dep_id not in listed:
+                listed.add(dep_id)
+                dependencies[package_id].append(dep_id)
+
+            if dep_id not in visited:
+                try:
+                    pkg_data = cached_package(cache, dep_id)
+                    if pkg_data is None:
                         url = f"{repository_url.rstrip('/')}/{dep_name}/{clean_version}"
-                        with urllib.request.urlopen(url) as response:
-                            pkg_data = json.loads(response.read())
-                            
-                        with open(f"{temp_dir}/package.json", 'w') as f:
-                            json.dump(pkg_data, f)
-
-                        get_dependencies(f"{temp_dir}/package.json", repository_url, dependencies, visited)
-
-                    except Exception as e:
-                        print(f"Ошибка при получении зависимостей для {dep_name}: {str(e)}")
-                        dependencies[package_id].remove(dep_id)
-                    
-                    finally:
-                        import shutil
-                        shutil.rmtree(temp_dir, ignore_errors=True)
+                        pkg_data = json.loads(download(url, pool))
+                        if cache is not None:
+                            cache.put(dep_id, pkg_data)
+
+                    collect_dependencies(pkg_data, repository_url, dependencies, visited, cache, pool)
+
+                except Exception as e:
+                    print(f"Ошибка при получении зависимостей для {dep_name}: {str(e)}")
+                    dependencies[package_id].remove(dep_id)
 
     return dependencies
 
+def package_id_of(package_data):
+    return f"{package_data.get('name', '')}@{package_data.get('version', '')}"
+
+def dependency_ids(package_data):
+    """Зависимости пакета в виде (имя, версия без ^ и ~, идентификатор), как в get_dependencies."""
+    result = []
+    for dep_name, dep_version in package_data.get('dependencies', {}).items():
+        clean_version = dep_version.replace('^', '').replace('~', '')
+        result.append((dep_name, clean_version, f"{dep_name}@{clean_version}"))
+    return result
+
+def fetch_package(repository_url, dep_name, version, pool=None):
+    """Загрузка package.json версии пакета из репозитория; возвращает (данные или ошибка, время)."""
+    start = perf_counter()
+    try:
+        url = f"{repository_url.rstrip('/')}/{dep_name}/{version}"
+        return json.loads(download(url, pool)), perf_counter() - start
+    except Exception as e:
+        return e, perf_counter() - start
+
+def preorder(root_id, children):
+    """
+    Пакеты в порядке обхода в глубину от корня - в том же порядке,
+    в котором их добавляет в словарь get_dependencies.
+    children - функция, возвращающая пакеты, от которых зависит пакет.
+    """
+    order = {root_id: None}
+    stack = [iter(children(root_id))]
+    while stack:
+        for package_id in stack[-1]:
+            if package_id not in order:
+                order[package_id] = None
+                stack.append(iter(children(package_id)))
+                break
+        else:
+            stack.pop()
+    return list(order)
+
+def resolve_dependencies(package_path, repository_url, jobs=16, cache=None, pool=None, compact=False):
+    """
+    Обход графа зависимостей в ширину: пакеты очередного уровня загружаются
+    одновременно пулом из jobs потоков, каждый пакет загружается один раз.
+    Результат совпадает с get_dependencies, включая порядок пакетов.
+    cache - MetadataCache; кэш читается и пополняется только в вызывающем потоке.
+    pool - ConnectionPool; без него каждый пакет загружается отдельным urlopen.
+    compact - вернуть граф DependencyGraph вместо словаря dependencies.
+    Возвращает (dependencies, stats): число загрузок, попаданий в кэш и ошибок,
+    число уровней, время обхода, суммарное время загрузок и достигнутый
+    параллелизм (суммарное время загрузок, делённое на время обхода).
+    """
+    start = perf_counter()
+    with open(package_path, 'r') as file:
+        root_data = json.load(file)
+
+    graph = DependencyGraph()   # идентификатор пакета -> идентификаторы его зависимостей
+    resolved = {}   # идентификатор зависимости -> идентификатор загруженного пакета или None
+    requested = set()
+    stats = {"fetches": 0, "cache_hits": 0, "errors": 0, "levels": 0, "max_frontier": 0, "fetch_seconds": 0.0}
+
+    def expand(package_data, frontier):
+        package_id = package_id_of(package_data)
+        if package_id in graph:
+            return package_id
+        deps = dependency_ids(package_data)
+        graph.add(package_id, [dep_id for _, _, dep_id in deps])
+        for dep_name, clean_version, dep_id in deps:
+            if dep_id not in graph and dep_id not in requested:
+                requested.add(dep_id)
+                frontier.append((dep_name, clean_version, dep_id))
+        return package_id
+
+    frontier = []
+    root_id = expand(root_data, frontier)
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        while frontier:
+            stats["levels"] += 1
+            stats["max_frontier"] = max(stats["max_frontier"], len(frontier))
+            cached = {}
+            for dep_name, _, dep_id in frontier:
+                try:
+                    package_data = cached_package(cache, dep_id)
+                except LookupError as e:
+                    package_data = e
+                if package_data is not None:
+                    cached[dep_id] = package_data
+            misses = [dep for dep in frontier if dep[2] not in cached]
+            fetched = executor.map(lambda dep: fetch_package(repository_url, dep[0], dep[1], pool), misses)
+            fetched = dict(zip((dep[2] for dep in misses), fetched))
+            next_frontier = []
+            for dep_name, _, dep_id in frontier:
+                if dep_id in cached:
+                    package_data = cached[dep_id]
+                    if not isinstance(package_data, Exception):
+                        stats["cache_hits"] += 1
+                else:
+                    package_data, seconds = fetched[dep_id]
+                    stats["fetches"] += 1
+                    stats["fetch_seconds"] += seconds
+                    if cache is not None and not isinstance(package_data, Exception):
+                        cache.put(dep_id, package_data)
+                if isinstance(package_data, Exception):
+                    print(f"Ошибка при получении зависимостей для {dep_name}: {str(package_data)}")
+                    stats["errors"] += 1
+                    resolved[dep_id] = None
+                else:
+                    resolved[dep_id] = expand(package_data, next_frontier)
+            frontier = next_frontier
+
+    # Рёбра к зависимостям, которые не удалось загрузить, удаляются, как в get_dependencies
+    def edges(package_id):
+        return [dep_id for dep_id in graph[package_id] if resolved.get(dep_id, dep_id) is not None]
+
+    def children(package_id):
+        return [resolved.get(dep_id, dep_id) for dep_id in edges(package_id)]
+
+    dependencies = DependencyGraph()
+    for package_id in preorder(root_id, children):
+        dependencies.add(package_id, edges(package_id))
+    if not compact:
+        dependencies = dependencies.to_dict()
+    stats["packages"] = len(dependencies)
+    stats["seconds"] = perf_counter() - start
+    stats["parallelism"] = stats["fetch_seconds"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return dependencies, stats
+
 def generate_plantuml_graph(dependencies):
     plantuml_code = "@startuml\n"
     plantuml_code += "skinparam defaultTextAlignment center\n"
@@ -75,8 +228,26 @@ def show_graph(image_path):
     else:
         subprocess.run(["xdg-open", image_path])
 
-def visualize_dependencies(plantuml_path, package_path, repository_url):
-    dependencies = get_dependencies(package_path, repository_url)
+def print_resolve_stats(stats):
+    print(f"Пакетов: {stats['packages']}, загрузок: {stats['fetches']}, из кэша: {stats['cache_hits']}, "
+          f"ошибок: {stats['errors']}, "
+          f"уровней: {stats['levels']}, время: {stats['seconds']:.3f} с, "
+          f"параллелизм: {stats['parallelism']:.1f}")
+
+def print_pool_stats(pool):
+    stats = pool.stats
+    print(f"HTTP запросов: {stats['requests']}, соединений открыто: {stats['connections']}, "
+          f"повторное использование: {pool.reuse_ratio():.0%}, "
+          f"получено: {stats['bytes_received'] / 1024:.1f} КиБ, после распаковки: {stats['bytes_decoded'] / 1024:.1f} КиБ")
+
+def visualize_dependencies(plantuml_path, package_path, repository_url, jobs=1, cache=None, pool=None):
+    if jobs > 1:
+        dependencies, stats = resolve_dependencies(package_path, repository_url, jobs, cache, pool, compact=True)
+        print_resolve_stats(stats)
+    else:
+        dependencies = get_dependencies(package_path, repository_url, cache=cache, pool=pool)
+    if pool is not None:
+        print_pool_stats(pool)
     plantuml_code = generate_plantuml_graph(dependencies)
 
     temp_puml = "dependency_graph.puml"
@@ -109,12 +280,38 @@ def visualize_dependencies(plantuml_path, package_path, repository_url):
             os.remove(temp_puml)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print(f"Использование: {sys.argv[0]} <путь_к_plantuml.jar> <путь_к_package.json> <URL_репозитория>")
-        sys.exit(1)
-
-    plantuml_path = sys.argv[1]
-    package_path = sys.argv[2]
-    repository_url = sys.argv[3]
+    arg_parser = argparse.ArgumentParser(description="Визуализация графа зависимостей npm пакета с помощью PlantUML")
+    arg_parser.add_argument("plantuml_path", help="Путь к plantuml.jar")
+    arg_parser.add_argument("package_path", help="Путь к package.json")
+    arg_parser.add_argument("repository_url", help="URL репозитория")
+    arg_parser.add_argument("--jobs", type=int, default=16,
+                            help="Число одновременных загрузок при обходе в ширину (1 - прежний обход в глубину)")
+    arg_parser.add_argument("--cache", default=DEFAULT_CACHE_PATH,
+                            help="Файл кэша метаданных пакетов (SQLite)")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Не использовать кэш метаданных")
+    arg_parser.add_argument("--ttl", type=float, default=24 * 60 * 60,
+                            help="Срок жизни записей для диапазонов версий и тегов, с (точные версии не устаревают)")
+    arg_parser.add_argument("--cache-size", type=int, default=100000,
+                            help="Наибольшее число записей кэша, давно не использованные удаляются")
+    arg_parser.add_argument("--offline", action="store_true",
+                            help="Разрешать зависимости только из кэша, без обращения к репозиторию")
+    arg_parser.add_argument("--no-keep-alive", action="store_true",
+                            help="Открывать отдельное соединение для каждого пакета (urlopen) вместо пула соединений")
+    arg_parser.add_argument("--no-compress", action="store_true", help="Не запрашивать ответы репозитория в gzip")
+    args = arg_parser.parse_args()
+    if args.offline and args.no_cache:
+        arg_parser.error("--offline требует кэш, уберите --no-cache")
 
-    visualize_dependencies(plantuml_path, package_path, repository_url)
+    cache = None
+    if not args.no_cache:
+        cache = MetadataCache(args.cache, args.ttl, args.cache_size, args.offline)
+    pool = None
+    if not args.no_keep_alive:
+        pool = ConnectionPool(max(1, args.jobs), compress=not args.no_compress)
+    try:
+        visualize_dependencies(args.plantuml_path, args.package_path, args.repository_url, args.jobs, cache, pool)
+    finally:
+        if cache is not None:
+            cache.close()
+        if pool is not None:
+            pool.close()
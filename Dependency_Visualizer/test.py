@@ -1,9 +1,20 @@
 import pytest
 import json
 import os
+import gzip
+import sys
+import urllib.error
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from unittest.mock import patch, mock_open, MagicMock
+from cache import MetadataCache, is_immutable
+from http_pool import ConnectionPool
+from graph import DependencyGraph
 from main import (
     get_dependencies,
+    collect_dependencies,
+    resolve_dependencies,
     generate_plantuml_graph,
     show_graph,
     visualize_dependencies
@@ -102,3 +113,227 @@ def test_visualize_dependencies_no_output_file(sample_dependencies):
                 with patch("builtins.open", mock_open()):
                     with pytest.raises(SystemExit):
                         visualize_dependencies("plantuml.jar", "package.json", "https://registry.npmjs.org")
+
+REGISTRY = {
+    "app@1.0.0": {"a": "^1.0.0", "b": "~2.0.0", "missing": "1.0.0"},
+    "a@1.0.0": {"c": "1.0.0", "d": "^1.0.0", "app": "1.0.0"},
+    "b@2.0.0": {"d": "1.0.0", "e": "1.0.0", "missing": "1.0.0"},
+    "c@1.0.0": {"e": "1.0.0"},
+    "d@1.0.0": {"f": "1.0.0"},
+    "e@1.0.0": {},
+    "f@1.0.0": {"a": "1.0.0"},
+}
+
+@pytest.fixture
+def registry():
+    """
+    Локальный репозиторий: GET /имя/версия отдаёт package.json с задержкой, как у сети.
+    Соединения HTTP/1.1 остаются открытыми, ответ сжимается, если клиент принимает gzip
+    """
+    requests = []
+    connections = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            connections.append(self.client_address)
+            super().setup()
+
+        def do_GET(self):
+            requests.append(self.path)
+            time.sleep(0.05)
+            name, version = self.path.strip("/").split("/")
+            package_id = f"{name}@{version}"
+            if package_id not in REGISTRY:
+                self.send_error(404)
+                return
+            body = json.dumps({"name": name, "version": version, "dependencies": REGISTRY[package_id],
+                               "description": "пакет " * 100}).encode()
+            self.send_response(200)
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/", requests, connections
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def root_package(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "package.json"
+    path.write_text(json.dumps({"name": "app", "version": "1.0.0", "dependencies": REGISTRY["app@1.0.0"]}))
+    return str(path)
+
+def test_resolve_dependencies_matches_sequential(registry, root_package):
+    """Обход в ширину даёт тот же словарь и тот же PlantUML граф, что и обход в глубину"""
+    url, requests, _ = registry
+    expected = get_dependencies(root_package, url)
+    requests.clear()
+    result, stats = resolve_dependencies(root_package, url, jobs=8)
+    assert result == expected
+    assert list(result) == list(expected)
+    assert generate_plantuml_graph(result) == generate_plantuml_graph(expected)
+    assert "missing@1.0.0" not in result["app@1.0.0"]
+    assert sorted(requests) == sorted(set(requests))
+    assert stats["fetches"] == len(requests) == 7
+    assert stats["errors"] == 1
+    assert stats["levels"] == 3
+    assert stats["parallelism"] > 1.5
+
+def test_resolve_dependencies_aliased_versions(root_package, tmp_path):
+    """Версии 1 и 1.0 указывают на пакет a@1.0.0: обход в глубину и в ширину дают один граф"""
+    root = {"name": "app", "version": "1.0.0", "dependencies": {"a": "^1", "b": "1"}}
+    with open(root_package, "w") as file:
+        json.dump(root, file)
+    cache_path = str(tmp_path / "metadata.sqlite")
+    with MetadataCache(cache_path) as cache:
+        a = {"name": "a", "version": "1.0.0", "dependencies": {"c": "1"}}
+        cache.put("a@1", a)
+        cache.put("a@1.0", a)
+        cache.put("b@1", {"name": "b", "version": "1", "dependencies": {"a": "1.0"}})
+        cache.put("c@1", {"name": "c", "version": "1", "dependencies": {}})
+    url = "http://127.0.0.1:1/"
+    with MetadataCache(cache_path, offline=True) as cache:
+        expected = get_dependencies(root_package, url, cache=cache)
+    with MetadataCache(cache_path, offline=True) as cache:
+        result = resolve_dependencies(root_package, url, 4, cache)[0]
+    assert expected["a@1.0.0"] == ["c@1"]
+    assert result == expected
+    assert list(result) == list(expected)
+
+def test_resolve_dependencies_network_error(sample_package_json):
+    """Ошибка сети удаляет зависимость из графа, как в get_dependencies"""
+    with patch("builtins.open", mock_open(read_data=json.dumps(sample_package_json))):
+        with patch("urllib.request.urlopen") as mock_urlopen:
+            mock_urlopen.side_effect = Exception("Network error")
+
+            result, stats = resolve_dependencies("fake_path.json", "https://registry.npmjs.org")
+            assert result == {"test-package@1.0.0": []}
+            assert stats["fetches"] == stats["errors"] == 2
+
+@pytest.mark.parametrize("jobs", [1, 8])
+def test_metadata_cache_repeat_and_offline(registry, root_package, tmp_path, jobs):
+    """Повторный обход с кэшем не обращается к репозиторию; offline работает без сети"""
+    url, requests, _ = registry
+    cache_path = str(tmp_path / "metadata.sqlite")
+
+    def resolve(cache):
+        if jobs == 1:
+            return get_dependencies(root_package, url, cache=cache)
+        return resolve_dependencies(root_package, url, jobs, cache)[0]
+
+    # Обход в глубину запрашивает отсутствующий пакет для каждого зависящего от него пакета
+    missing = ["/missing/1.0.0"] * (2 if jobs == 1 else 1)
+    with MetadataCache(cache_path) as cache:
+        expected = resolve(cache)
+    assert len(requests) == 6 + len(missing)
+    requests.clear()
+    with MetadataCache(cache_path) as cache:
+        assert resolve(cache) == expected
+        assert cache.hits == 6
+    # Отсутствующий в репозитории пакет не кэшируется и запрашивается снова
+    assert requests == missing
+    requests.clear()
+    with MetadataCache(cache_path, offline=True) as cache:
+        assert resolve(cache) == expected
+    assert requests == []
+
+def test_metadata_cache_ttl_and_size(tmp_path):
+    """Записи диапазонов версий устаревают, точные версии - нет; размер кэша ограничен"""
+    cache_path = str(tmp_path / "metadata.sqlite")
+    package = {"name": "a", "version": "1.2.0", "dependencies": {}, "readme": "x" * 1000}
+    with MetadataCache(cache_path, ttl=0.01, max_entries=2) as cache:
+        cache.put("a@1.2.0", package)
+        cache.put("a@1.x", package)
+        cache.put("a@latest", package)
+        assert cache.get("a@1.2.0") == {"name": "a", "version": "1.2.0", "dependencies": {}}
+        time.sleep(0.02)
+        assert cache.get("a@1.x") is None
+        assert cache.get("a@1.2.0") is not None
+        cache.offline = True
+        assert cache.get("a@latest") is not None
+        cache.offline = False
+    with MetadataCache(cache_path, ttl=0.01, max_entries=2) as cache:
+        assert len(cache) == 1
+    assert is_immutable("@scope/name@1.0.0-beta.1") and not is_immutable("name@>=1.0.0")
+
+def test_collect_dependencies_in_memory(registry, root_package, tmp_path):
+    """Обход работает с package.json в памяти и не создаёт временных каталогов"""
+    url, requests, _ = registry
+    package_data = {"name": "app", "version": "1.0.0", "dependencies": REGISTRY["app@1.0.0"]}
+    assert collect_dependencies(package_data, url) == get_dependencies(root_package, url)
+    assert os.listdir(tmp_path) == ["package.json"]
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_connection_pool(registry, root_package, jobs):
+    """Пул переиспользует соединения и распаковывает gzip; результат тот же, что с urlopen"""
+    url, requests, connections = registry
+    expected = get_dependencies(root_package, url)
+    assert len(connections) == len(requests)
+    connections.clear()
+    with ConnectionPool(max_connections=jobs) as pool:
+        if jobs == 1:
+            result = get_dependencies(root_package, url, pool=pool)
+        else:
+            result = resolve_dependencies(root_package, url, jobs, pool=pool)[0]
+        stats = pool.stats
+    assert result == expected
+    assert stats["connections"] == len(connections) <= jobs + 2
+    assert stats["requests"] == stats["connections"] + stats["reused"]
+    assert 0 < pool.reuse_ratio() < 1
+    assert stats["bytes_received"] * 5 < stats["bytes_decoded"]
+
+def test_connection_pool_http_error(registry):
+    """Ошибка HTTP выдаётся так же, как urlopen; ответ с ошибкой закрывает соединение"""
+    url, _, connections = registry
+    with ConnectionPool(compress=False) as pool:
+        with pytest.raises(urllib.error.HTTPError, match="HTTP Error 404"):
+            pool.get(f"{url}missing/1.0.0")
+        received = pool.stats["bytes_received"]
+        bodies = [pool.get(f"{url}e/1.0.0"), pool.get(f"{url}c/1.0.0")]
+        assert [json.loads(body)["name"] for body in bodies] == ["e", "c"]
+        assert pool.stats["connections"] == len(connections) == 2
+        assert pool.stats["bytes_received"] - received == pool.stats["bytes_decoded"] == sum(map(len, bodies))
+
+def test_dependency_graph_dict_round_trip(sample_dependencies):
+    """Граф хранит тот же порядок пакетов и зависимостей, что и словарь, и выдаёт тот же PlantUML"""
+    dependencies = dict(sample_dependencies, **{"dep1@1.0.0": ["dep2@2.0.0"], "dep2@2.0.0": []})
+    graph = DependencyGraph.from_dict(dependencies)
+    assert graph.to_dict() == dependencies
+    assert list(graph) == list(dependencies)
+    assert generate_plantuml_graph(graph) == generate_plantuml_graph(dependencies)
+    assert len(graph) == 3 and graph.edge_count() == 3
+    assert graph["dep1@1.0.0"] == ["dep2@2.0.0"]
+    assert "dep2@2.0.0" in graph and "other@1.0.0" not in graph
+    with pytest.raises(ValueError):
+        graph.add("dep2@2.0.0", [])
+
+def test_dependency_graph_interning_and_dedup():
+    """Имена интернируются, повторные рёбра отбрасываются, зависимость без строки не считается пакетом"""
+    graph = DependencyGraph()
+    graph.add("app@1.0.0", ["a@" + "1.0.0", "b@1.0.0", "a@1.0." + "0"])
+    assert graph["app@1.0.0"] == ["a@1.0.0", "b@1.0.0"]
+    assert list(graph.successors(graph.index["app@1.0.0"])) == [1, 2]
+    assert graph.names[1] is sys.intern("a@1.0.0")
+    assert "a@1.0.0" not in graph
+    with pytest.raises(KeyError):
+        graph["a@1.0.0"]
+
+def test_resolve_dependencies_compact(registry, root_package):
+    """compact=True возвращает DependencyGraph с тем же содержимым"""
+    url, _, _ = registry
+    expected, _ = resolve_dependencies(root_package, url, jobs=4)
+    graph, _ = resolve_dependencies(root_package, url, jobs=4, compact=True)
+    assert isinstance(graph, DependencyGraph)
+    assert list(graph.items()) == list(expected.items())
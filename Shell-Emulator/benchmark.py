@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter
+from zipfile import ZipFile
+
+from main import Terminal
+from vfs import ArchiveIndex, Overlay
+
+
+class BenchmarkApplication:
+    """Заглушка приложения: вывод не сохраняется, только считаются строки."""
+    def __init__(self, terminal):
+        self.lines = 0
+        self.terminal = terminal
+        self.terminal.link(self)
+
+    def print(self, text, type):
+        self.lines += text.count("\n") + 1
+
+    def exit(self):
+        pass
+
+
+def generate_archive(path, members, shape, fanout=32):
+    """
+    Синтетический архив: wide - файлы в fanout директориях первого уровня,
+    deep - цепочка вложенных директорий глубиной fanout с файлами на каждом уровне.
+    Возвращает список директорий архива.
+    """
+    if shape == "wide":
+        directories = [f"dir_{i}/" for i in range(fanout)]
+    else:
+        directories = []
+        current = ""
+        for i in range(fanout):
+            current += f"level_{i}/"
+            directories.append(current)
+    with ZipFile(path, "w") as archive:
+        for directory in directories:
+            archive.writestr(directory, "")
+        for i in range(members - len(directories)):
+            archive.writestr(f"{directories[i % len(directories)]}file_{i}.txt", "x")
+    return directories
+
+
+def make_commands(command, directories, count, rng):
+    if command == "ls":
+        return [f"ls /{rng.choice(directories)}" for _ in range(count)]
+    if command == "cd":
+        return [f"cd /{rng.choice(directories)}" for _ in range(count)]
+    if command == "touch":
+        return ["touch bench.txt"] * count
+    if command == "find":
+        return [f"find /{rng.choice(directories)} -name file_1*" for _ in range(count)]
+    raise ValueError(command)
+
+
+def measure(terminal, commands):
+    start = perf_counter()
+    for line in commands:
+        terminal.command_dispatcher(line)
+    return perf_counter() - start
+
+
+def measure_peak(action):
+    tracemalloc.start()
+    try:
+        action()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(work_dir, members, shape, commands, ops, seed):
+    archive_path = os.path.join(work_dir, f"{shape}_{members}.zip")
+    directories = generate_archive(archive_path, members, shape)
+    results = []
+
+    def record(command, count, elapsed, peak):
+        results.append({
+            "members": members,
+            "shape": shape,
+            "command": command,
+            "ops": count,
+            "seconds": elapsed,
+            "ops_per_sec": count / elapsed if elapsed > 0 else None,
+            "mean_ms": elapsed / count * 1000,
+            "peak_kib": peak / 1024,
+        })
+
+    for cached in (False, True):
+        if not cached and os.path.exists(f"{archive_path}.idx"):
+            os.remove(f"{archive_path}.idx")
+        start = perf_counter()
+        filesystem = Overlay(ArchiveIndex.load(archive_path))
+        elapsed = perf_counter() - start
+        filesystem.close()
+        peak = measure_peak(lambda: Overlay(ArchiveIndex.load(archive_path)).close())
+        record("startup_cached" if cached else "startup_scan", 1, elapsed, peak)
+
+    filesystem = Overlay(ArchiveIndex.load(archive_path))
+    terminal = Terminal("bench", archive_path, filesystem, os.path.join(work_dir, "log.csv"))
+    BenchmarkApplication(terminal)
+    rng = random.Random(seed)
+    for command in commands:
+        lines = make_commands(command, directories, ops, rng)
+        terminal.path = ""
+        elapsed = measure(terminal, lines)
+        # Пик памяти измеряется отдельным коротким прогоном: трассировка замедляет команды
+        sample = lines[:max(1, ops // 10)]
+        peak = measure_peak(lambda: measure(terminal, sample))
+        record(command, len(lines), elapsed, peak)
+    terminal.close()
+    filesystem.close()
+    os.remove(archive_path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк операций виртуальной файловой системы эмулятора")
+    parser.add_argument("--members", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Размеры синтетических архивов (число членов)")
+    parser.add_argument("--shapes", nargs="+", choices=["wide", "deep"], default=["wide", "deep"])
+    parser.add_argument("--commands", nargs="+", choices=["ls", "cd", "touch", "find"], default=["ls", "cd", "touch"])
+    parser.add_argument("--ops", type=int, default=200, help="Число повторений каждой команды")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json", help="Файл с результатами в формате JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for members in args.members:
+            for shape in args.shapes:
+                for result in run_case(work_dir, members, shape, args.commands, args.ops, args.seed):
+                    results.append(result)
+                    print(f"{result['shape']:>5} {result['members']:>8} {result['command']:>15}: "
+                          f"{result['ops_per_sec'] or 0:>12.1f} оп/с, {result['mean_ms']:>9.3f} мс, "
+                          f"пик {result['peak_kib']:>10.1f} КиБ", file=sys.stderr)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ops": args.ops,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import sys
+from time import perf_counter
+
+from main import percentile
+
+DEFAULT_COMMANDS = ["ls", "cd Yesenin_s_dir_1", "ls", "cd ..", "rev hello", "uname", "find -name *.txt", "du"]
+
+
+async def read_response(reader):
+    """Чтение вывода команды до приглашения к вводу."""
+    data = b""
+    while True:
+        data += await reader.readuntil(b"$ ")
+        last_line = data.rsplit(b"\n", 1)[-1]
+        if b":~" in last_line:
+            return data
+
+
+async def session(args, commands, latencies):
+    if args.unix:
+        reader, writer = await asyncio.open_unix_connection(args.unix)
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    try:
+        await read_response(reader)
+        for i in range(args.commands):
+            line = commands[i % len(commands)]
+            start = perf_counter()
+            writer.write(f"{line}\n".encode("utf-8"))
+            await writer.drain()
+            await read_response(reader)
+            latencies.append(perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run(args, commands):
+    latencies = []
+    start = perf_counter()
+    results = await asyncio.gather(*(session(args, commands, latencies) for _ in range(args.sessions)),
+                                   return_exceptions=True)
+    elapsed = perf_counter() - start
+    errors = [result for result in results if isinstance(result, Exception)]
+    return latencies, elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный клиент для server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8022)
+    parser.add_argument("--unix", help="Путь к Unix-сокету сервера")
+    parser.add_argument("--sessions", type=int, default=200, help="Число одновременных сеансов")
+    parser.add_argument("--commands", type=int, default=50, help="Число команд в каждом сеансе")
+    parser.add_argument("--script", help="Файл с командами (по умолчанию набор команд чтения)")
+    args = parser.parse_args()
+    commands = DEFAULT_COMMANDS
+    if args.script:
+        with open(args.script, "r", encoding="UTF-8") as script:
+            commands = [line.strip() for line in script if line.strip() and line.strip() != "exit"]
+    latencies, elapsed, errors = asyncio.run(run(args, commands))
+    count = len(latencies)
+    print(f"Сеансов: {args.sessions}, команд: {count}, ошибок сеансов: {len(errors)}")
+    print(f"Время: {elapsed:.3f} с, команд/с: {count / elapsed if elapsed > 0 else 0.0:.1f}")
+    if count > 0:
+        latencies.sort()
+        percentiles = ", ".join(f"p{q}={percentile(latencies, q) * 1000:.3f}" for q in (50, 90, 99))
+        print(f"Задержка, мс: {percentiles}, max={latencies[-1] * 1000:.3f}")
+    if errors:
+        print(f"Первая ошибка: {errors[0]!r}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
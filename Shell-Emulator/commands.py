@@ -0,0 +1,188 @@
+import io
+import platform
+import zlib
+from fnmatch import fnmatchcase
+from zipfile import BadZipFile
+
+# Реестр команд эмулятора: имя -> экземпляр команды
+COMMANDS = {}
+
+
+class Command:
+    """
+    Базовый класс команды эмулятора.
+    Подкласс с заданным name автоматически регистрируется в COMMANDS.
+    Метод run - генератор строк вывода; stdin - итератор строк предыдущей
+    команды конвейера или None. Сообщения об ошибках выводятся сразу через
+    terminal.application.print. Команды с mutates = True изменяют файловую
+    систему, и сервер выполняет их последовательно в одной задаче записи.
+    """
+    name = None
+    mutates = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.name is not None:
+            COMMANDS[cls.name] = cls()
+
+    def run(self, terminal, args, stdin):
+        raise NotImplementedError
+
+
+class Exit(Command):
+    name = "exit"
+
+    def run(self, terminal, args, stdin):
+        terminal.close()
+        terminal.application.exit()
+        yield from ()
+
+
+class Ls(Command):
+    name = "ls"
+
+    def run(self, terminal, args, stdin):
+        work_dir = terminal.path
+        if len(args) > 0:
+            work_dir = terminal.cd(args[-1:])
+            if work_dir is None:
+                return
+        yield from terminal.tree.listdir(work_dir)
+
+
+class Cd(Command):
+    name = "cd"
+
+    def run(self, terminal, args, stdin):
+        temp_dir = terminal.cd(args)
+        if temp_dir is not None:
+            terminal.path = temp_dir
+        yield from ()
+
+
+class Uname(Command):
+    name = "uname"
+
+    def run(self, terminal, args, stdin):
+        system_info = platform.uname()
+        yield f"{system_info.system} {system_info.node} {system_info.release}"
+
+
+class Rev(Command):
+    name = "rev"
+
+    def run(self, terminal, args, stdin):
+        if len(args) > 0:
+            yield " ".join(args)[::-1]
+        elif stdin is not None:
+            for line in stdin:
+                yield line[::-1]
+        else:
+            terminal.application.print("Не указан текст для разворота.", "error")
+
+
+class Touch(Command):
+    name = "touch"
+    mutates = True
+
+    def run(self, terminal, args, stdin):
+        terminal.touch(args)
+        yield from ()
+
+
+class Sync(Command):
+    name = "sync"
+    mutates = True
+
+    def run(self, terminal, args, stdin):
+        terminal.sync()
+        yield from ()
+
+
+class Cat(Command):
+    name = "cat"
+    max_line = 1 << 20  # Более длинная строка без перевода выводится частями
+
+    def run(self, terminal, args, stdin):
+        if len(args) == 0:
+            if stdin is not None:
+                yield from stdin
+            else:
+                terminal.application.print("Не указано имя файла.", "error")
+            return
+        name = terminal.resolve(" ".join(args))
+        if name is None:
+            return
+        node = terminal.tree.find(name)
+        if node is None or node.is_dir:
+            terminal.application.print("Файл с таким названием отсутствует.", "error")
+            return
+        # Файл читается кусками, наружу отдаются целые строки; хвост без перевода
+        # строки длиннее max_line отдаётся частью, чтобы память была ограничена
+        try:
+            with terminal.filesystem.open(name) as member:
+                text = io.TextIOWrapper(member, encoding="utf-8", errors="replace", newline="")
+                rest = ""
+                while True:
+                    chunk = text.read(1 << 16)
+                    if not chunk:
+                        break
+                    lines = (rest + chunk).split("\n")
+                    rest = lines.pop()
+                    for line in lines:
+                        yield line.rstrip("\r")
+                    if len(rest) >= self.max_line:
+                        yield rest
+                        rest = ""
+                if rest:
+                    yield rest.rstrip("\r")
+        except (OSError, zlib.error, KeyError, BadZipFile):
+            # Повреждённый или исчезнувший из архива член
+            terminal.application.print("Не удалось прочитать файл.", "error")
+
+
+class Du(Command):
+    name = "du"
+
+    def run(self, terminal, args, stdin):
+        path = terminal.path
+        if len(args) > 0:
+            path = terminal.resolve(args[-1])
+            if path is None:
+                return
+        node = terminal.tree.find(path)
+        if node is None:
+            terminal.application.print("Файл или директория с таким названием отсутствует.", "error")
+            return
+        path = path.rstrip('/')
+        if node.is_dir:
+            prefix = f"{path}/" if path else ""
+            for name in node.order:
+                child = node.children[name]
+                if child.is_dir:
+                    yield f"{child.size}\t{prefix}{name}"
+        yield f"{node.size}\t{path or '.'}"
+
+
+class Find(Command):
+    name = "find"
+
+    def run(self, terminal, args, stdin):
+        path, pattern = terminal.path, None
+        args = list(args)
+        if len(args) >= 2 and args[-2] == "-name":
+            pattern = args[-1]
+            args = args[:-2]
+        if len(args) > 1 or (args and args[0].startswith('-')):
+            terminal.application.print("Использование: find [путь] [-name шаблон]", "error")
+            return
+        if args:
+            path = terminal.resolve(args[0])
+            if path is None:
+                return
+        if terminal.tree.find(path) is None:
+            terminal.application.print("Файл или директория с таким названием отсутствует.", "error")
+            return
+        for found_path, node in terminal.tree.walk(path):
+            if pattern is None or fnmatchcase(node.name, pattern):
+                yield found_path or "."
@@ -2,11 +2,18 @@ import tkinter as tk
 from zipfile import ZipFile
 import csv
 from datetime import datetime
-import platform
+import os
+import sys
+import threading
+from collections import deque
+from math import ceil
+from time import perf_counter
 from sys import argv, exit
+from vfs import ArchiveIndex, Overlay, complete_sorted
+from commands import COMMANDS
 
 class Application:
-    def __init__(self, terminal):
+    def __init__(self, terminal, scrollback=5000):
         self.root = tk.Tk()
         self.root.title("Гнесь Я.Э.")
         self.root.geometry("800x600")
@@ -22,6 +29,12 @@ class Application:
         self.input = tk.Entry(self.root, bg="#000000", fg="#FFCC00", font=("Consolas", 10))
         self.input.pack(fill=tk.X, side=tk.BOTTOM, padx=10, pady=10)
         self.input.bind("<Return>", self.read)
+        self.input.bind("<Tab>", self.complete)
+        self.root.protocol("WM_DELETE_WINDOW", self.exit)
+        # Вывод копится в кольцевом буфере и отрисовывается раз за итерацию цикла событий
+        self.scrollback = scrollback
+        self.pending = deque(maxlen=scrollback)
+        self.flush_scheduled = False
         self.terminal = terminal
         self.terminal.link(self)
 
@@ -34,13 +47,49 @@ class Application:
         else:
             self.print("", "input")
 
+    def complete(self, event):
+        line = self.input.get()
+        completed, matches = self.terminal.complete(line)
+        if completed != line:
+            self.input.delete(0, tk.END)
+            self.input.insert(0, completed)
+        elif len(matches) > 1:
+            self.print(' ' + line, "input")
+            self.print('  '.join(matches), "command")
+        return "break"
+
     def print(self, text, type):
         color_tag = "input" if type == "input" else "command" if type == "command" else "error"
-        self.output.config(state=tk.NORMAL)
         if type == "input":
-            self.output.insert(tk.END, f"{self.terminal.username}:~{self.terminal.path}${text}\n", color_tag)
-        else:
-            self.output.insert(tk.END, f"{text}\n", color_tag)
+            text = f"{self.terminal.username}:~{self.terminal.path}${text}"
+        lines = text.rsplit("\n", self.scrollback)
+        if len(lines) > self.scrollback:
+            lines = lines[1:]
+        self.pending.extend((line, color_tag) for line in lines)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.root.after_idle(self.flush)
+
+    def flush(self):
+        self.flush_scheduled = False
+        if not self.pending:
+            return
+        # Соседние строки с одинаковым тегом вставляются одним фрагментом
+        chunks = []
+        lines, current_tag = [], None
+        for line, color_tag in self.pending:
+            if color_tag != current_tag and lines:
+                chunks += ["\n".join(lines) + "\n", current_tag]
+                lines = []
+            lines.append(line)
+            current_tag = color_tag
+        chunks += ["\n".join(lines) + "\n", current_tag]
+        self.pending.clear()
+        self.output.config(state=tk.NORMAL)
+        self.output.insert(tk.END, *chunks)
+        excess = int(self.output.index("end-1c").split(".")[0]) - 1 - self.scrollback
+        if excess > 0:
+            self.output.delete("1.0", f"{excess + 1}.0")
         self.output.config(state=tk.DISABLED)
         self.output.see(tk.END)
 
@@ -48,106 +97,289 @@ class Application:
         self.root.mainloop()
 
     def exit(self):
+        self.terminal.close()
         self.root.destroy()
         exit()
 
+class HeadlessApplication:
+    """
+    Пакетный режим без графического интерфейса.
+    Команды читаются из файла или stdin (в том числе из журнала в формате
+    log.csv), вывод пишется в stdout, по завершении в stderr выводится
+    пропускная способность и перцентили задержки команд.
+    """
+    def __init__(self, terminal, script, stream=sys.stdout, report_stream=sys.stderr):
+        self.script = script
+        self.stream = stream
+        self.report_stream = report_stream
+        self.running = False
+        self.latencies = []
+        self.terminal = terminal
+        self.terminal.link(self)
+
+    def print(self, text, type):
+        if type == "input":
+            self.stream.write(f"{self.terminal.username}:~{self.terminal.path}${text}\n")
+        else:
+            self.stream.write(f"{text}\n")
+
+    def run(self):
+        self.running = True
+        start = perf_counter()
+        for line in read_script(self.script):
+            self.print(' ' + line, "input")
+            command_start = perf_counter()
+            self.terminal.command_dispatcher(line)
+            self.latencies.append(perf_counter() - command_start)
+            if not self.running:
+                break
+        elapsed = perf_counter() - start
+        self.terminal.close()
+        self.stream.flush()
+        self.report_stream.write(self.report(elapsed) + "\n")
+
+    def report(self, elapsed):
+        count = len(self.latencies)
+        rate = count / elapsed if elapsed > 0 else 0.0
+        lines = [f"Команд: {count}, время: {elapsed:.3f} с, команд/с: {rate:.1f}"]
+        if count > 0:
+            latencies = sorted(self.latencies)
+            percentiles = ", ".join(f"p{q}={percentile(latencies, q) * 1000:.3f}" for q in (50, 90, 99))
+            lines.append(f"Задержка, мс: {percentiles}, max={latencies[-1] * 1000:.3f}")
+        return "\n".join(lines)
+
+    def exit(self):
+        self.running = False
+
+def percentile(sorted_values, q):
+    index = max(ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+def read_script(lines):
+    """Команды из скрипта; строки журнала вида "дата,команда" заменяются командой."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        row = next(csv.reader([line]))
+        if len(row) == 2:
+            try:
+                datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S")
+                line = row[1].strip()
+            except ValueError:
+                pass
+        if line:
+            yield line
+
+class LogWriter:
+    """
+    Буферизованная запись журнала команд.
+    Строки копятся в памяти и сбрасываются в файл фоновым потоком, когда их
+    набирается batch_size или проходит interval секунд. При fsync_every > 0
+    файл синхронизируется с диском каждые fsync_every строк.
+    """
+    def __init__(self, log_path, fsync_every=0, batch_size=256, interval=1.0):
+        self.log_path = log_path
+        self.fsync_every = fsync_every
+        self.batch_size = batch_size
+        self.interval = interval
+        self.rows = []
+        self.closing = False
+        self.thread = None
+        self.condition = threading.Condition()
+
+    def write(self, row):
+        with self.condition:
+            self.rows.append(row)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            elif len(self.rows) >= self.batch_size:
+                self.condition.notify()
+
+    def _run(self):
+        unsynced = 0
+        with open(self.log_path, 'a', newline='') as log_file:
+            writer = csv.writer(log_file)
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.closing or len(self.rows) >= self.batch_size, self.interval)
+                    rows, self.rows = self.rows, []
+                    closing = self.closing
+                if rows:
+                    writer.writerows(rows)
+                    log_file.flush()
+                    unsynced += len(rows)
+                    if self.fsync_every > 0 and (unsynced >= self.fsync_every or closing):
+                        os.fsync(log_file.fileno())
+                        unsynced = 0
+                if closing:
+                    break
+
+    def close(self):
+        with self.condition:
+            thread = self.thread
+            if thread is None:
+                return
+            self.closing = True
+            self.condition.notify()
+        thread.join()
+        with self.condition:
+            self.thread = None
+            self.closing = False
+
 class Terminal:
-    def __init__(self, name, fs_path, file_system: ZipFile, log_path):
+    def __init__(self, name, fs_path, file_system: ZipFile, log_path, fsync_every=0, log=None):
         self.username = name
         self.fs_path = fs_path
-        self.filesystem = file_system
+        self.filesystem = file_system if isinstance(file_system, Overlay) else Overlay(file_system)
+        self.tree = self.filesystem.tree
         self.log_path = log_path
+        # Общий журнал (log) закрывает его владелец, например сервер, а не сеанс
+        self.owns_log = log is None
+        self.log = log if log is not None else LogWriter(log_path, fsync_every)
         self.path = ""
         self.application = None
+        self.batch_size = 1000
+        self.timing_hooks = []  # Функции hook(имя команды, аргументы, время в секундах)
 
     def link(self, app: Application):
         self.application = app
 
     def log_command(self, command):
-        with open(self.log_path, 'a', newline='') as log_file:
-            writer = csv.writer(log_file)
-            writer.writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), command])
+        self.log.write([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), command])
+
+    def close(self):
+        if self.owns_log:
+            self.log.close()
 
     def command_dispatcher(self, string):
         self.log_command(string)
-        line = string.split()
-        if line[0] == "exit":
-            self.application.exit()
-        elif line[0] == "ls":
-            self.ls(line[1:])
-        elif line[0] == "cd":
-            temp_dir = self.cd(line[1:])
-            if temp_dir is not None:
-                self.path = temp_dir
-        elif line[0] == "uname":
-            self.uname()
-        elif line[0] == "rev":
-            self.rev(line[1:])
-        elif line[0] == "touch":
-            self.touch(line[1:])
-        else:
-            self.application.print("Работа данной команды не предусмотрена в данном эмуляторе.", "error")
+        stages = []
+        for part in string.split("|"):
+            line = part.split()
+            if not line:
+                self.application.print("Пустая команда в конвейере.", "error")
+                return
+            command = COMMANDS.get(line[0])
+            if command is None:
+                self.application.print("Работа данной команды не предусмотрена в данном эмуляторе.", "error")
+                return
+            stages.append((command, line[1:]))
+        self.run_pipeline(stages)
 
-    def ls(self, args):
-        work_dir = self.path
-        if len(args) > 0:
-            work_dir = self.cd(args[-1])
-            if work_dir is None:
-                self.application.print("", "command")
-        items = set()
-        for item in self.filesystem.namelist():
-            if item.startswith(work_dir):
-                ls_name = item[len(work_dir):]
-                if "/" in ls_name:
-                    ls_name = ls_name[:ls_name.index("/")]
-                items.add(ls_name)
-        self.application.print('\n'.join(sorted(filter(lambda x: len(x) > 0, items))), "command")
+    def run_pipeline(self, stages):
+        """
+        Выполнение конвейера: вывод каждой команды лениво передаётся следующей,
+        вывод последней печатается пачками по batch_size строк.
+        """
+        output, pipeline, timings = None, [], []
+        for command, args in stages:
+            output = command.run(self, args, output)
+            if self.timing_hooks:
+                upstream = timings[-1] if timings else None
+                timings.append([0.0, 0.0])
+                output = self.timed(output, timings[-1], upstream)
+            pipeline.append(output)
+        batch = []
+        for line in output:
+            batch.append(line)
+            if len(batch) >= self.batch_size:
+                self.application.print('\n'.join(batch), "command")
+                batch = []
+        if batch:
+            self.application.print('\n'.join(batch), "command")
+        # Команды, вывод которых не был прочитан, всё равно выполняются до конца
+        for stage in pipeline[:-1]:
+            for _ in stage:
+                pass
+        for (command, args), (elapsed, _) in zip(stages, timings):
+            for hook in self.timing_hooks:
+                hook(command.name, args, elapsed)
 
-    def cd(self, args):
-        if len(args) == 0:
-            return ""
-        directory = args[-1]
-        directory = directory.strip('/')
-        directory = directory.split('/')
-        new_dir = self.path[:-1].split('/')
+    @staticmethod
+    def timed(lines, elapsed, upstream=None):
+        """
+        Замер времени команды: elapsed = [собственное время, время вместе
+        с предыдущими командами]. Из каждого вызова next вычитается время,
+        за которое при этом вызове выросло полное время предыдущей команды,
+        поэтому результат не зависит от того, кто вычитывает её вывод.
+        """
+        iterator = iter(lines)
+        while True:
+            before = upstream[1] if upstream is not None else 0.0
+            start = perf_counter()
+            try:
+                line = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                spent = perf_counter() - start
+                elapsed[1] += spent
+                if upstream is not None:
+                    spent -= upstream[1] - before
+                elapsed[0] += spent
+            yield line
+
+    def complete(self, line):
+        """
+        Дополнение последнего слова строки: имени команды или пути.
+        Возвращает дополненную строку и список вариантов (не более 100).
+        """
+        words = line.rpartition("|")[2].lstrip()
+        head = line[:len(line) - len(words)]
+        if " " not in words:
+            commands = sorted(COMMANDS)
+            common, matches = complete_sorted(commands, words)
+            if len(matches) == 1:
+                common += " "
+            return head + common, matches
+        word_start = words.rfind(" ") + 1
+        word = words[word_start:]
+        head += words[:word_start]
+        directory, slash, prefix = word.rpartition("/")
+        path = self.resolve(directory + slash, quiet=True)
+        if path is None:
+            return line, []
+        common, matches = self.tree.complete(path, prefix)
+        if len(matches) == 1:
+            node = self.tree.find(f"{path}/{common}" if path else common)
+            common += "/" if node.is_dir else " "
+        return head + directory + slash + common, matches
+
+    def resolve(self, path, quiet=False):
+        new_dir = [] if path.startswith('/') else self.path[:-1].split('/')
         if new_dir == [""]:
             new_dir = []
-        for arg in directory:
+        for arg in path.split('/'):
             if arg == "..":
                 if len(new_dir) > 0:
                     new_dir.pop()
                 else:
-                    self.application.print("Некорректный путь к директории.", "error")
+                    if not quiet:
+                        self.application.print("Некорректный путь к директории.", "error")
                     return
-            else:
+            elif arg and arg != ".":
                 new_dir.append(arg)
-        new_path = "/".join(new_dir) + "/"
-        if new_path == "/":
+        return "/".join(new_dir)
+
+    def cd(self, args):
+        if len(args) == 0:
+            return ""
+        new_path = self.resolve(args[-1])
+        if new_path is None:
+            return
+        if new_path == "":
             return ""
-        for file in self.filesystem.namelist():
-            if file.startswith(new_path):
-                return new_path
+        node = self.tree.find(new_path)
+        if node is not None and node.is_dir:
+            return new_path + "/"
         self.application.print("Директория с таким названием отсутствует.", "error")
 
-    def uname(self):
-        system_info = platform.uname()
-        self.application.print(f"{system_info.system} {system_info.node} {system_info.release}", "command")
-
-    def rev(self, args):
-        if len(args) > 0:
-            text = " ".join(args)
-            self.application.print(text[::-1], "command")
-        else:
-            self.application.print("Не указан текст для разворота.", "error")
-
     def touch(self, args):
         if len(args) > 0:
             filename = args[-1]
-            unique_filename = filename
-            counter = 1
-            while f"{self.path}{unique_filename}" in self.filesystem.namelist():
-                unique_filename = f"{filename.split('.')[0]}_{counter}.{filename.split('.')[-1]}"
-                counter += 1
+            unique_filename = self.tree.unique_name(self.path, filename)
             try:
                 self.filesystem.writestr(f"{self.path}{unique_filename}", "")
             except:
@@ -155,19 +387,67 @@ class Terminal:
         else:
             self.application.print("Не указано имя файла.", "error")
 
+    def sync(self):
+        try:
+            self.filesystem.compact()
+        except OSError:
+            self.application.print("Не удалось записать архив.", "error")
+
+def read_config(config_file):
+    with open(config_file, "r", encoding="UTF-8") as file:
+        csv_reader = csv.reader(file)
+        return {
+            "username": next(csv_reader)[0],
+            "filesystem_path": next(csv_reader)[0],
+            "log_path": next(csv_reader)[0],
+            "fsync_every": read_number(csv_reader, 0),
+            "scrollback": read_number(csv_reader, 5000),
+        }
+
+def read_number(csv_reader, default):
+    """Необязательное число из очередной строки конфигурации; нет строки или пустая ячейка - default."""
+    row = next(csv_reader, None)
+    if not row or not row[0].strip():
+        return default
+    return int(row[0])
+
+def open_filesystem(filesystem_path):
+    start = perf_counter()
+    index = ArchiveIndex.load(filesystem_path)
+    file_system = Overlay(index, f"{filesystem_path}.journal")
+    mode = "индекс из кэша" if index.cached else "полное сканирование архива"
+    print(f"Запуск: {mode}, индекс {index.load_time * 1000:.1f} мс, всего {(perf_counter() - start) * 1000:.1f} мс", file=sys.stderr)
+    return file_system
+
+def close_filesystem(file_system):
+    if file_system.dirty:
+        file_system.compact()
+    file_system.close()
+
 def main():
     if len(argv) > 1:
         config_file = argv[1]
+        script_path = argv[2] if len(argv) > 2 else None
         try:
-            with open(config_file, "r", encoding="UTF-8") as file:
-                csv_reader = csv.reader(file)
-                username = next(csv_reader)[0]
-                filesystem_path = next(csv_reader)[0]
-                log_path = next(csv_reader)[0]
-                with ZipFile(filesystem_path, 'a') as file_system:
-                    Application(Terminal(username, filesystem_path, file_system, log_path)).run()
-        except FileNotFoundError:
-            print(f"Файл {config_file} не найден.")
+            config = read_config(config_file)
+            if script_path is not None and script_path != "-" and os.path.abspath(script_path) == os.path.abspath(config["log_path"]):
+                print("Нельзя воспроизводить журнал, в который ведётся запись.")
+                return
+            file_system = open_filesystem(config["filesystem_path"])
+            terminal = Terminal(config["username"], config["filesystem_path"], file_system, config["log_path"], config["fsync_every"])
+            try:
+                if script_path is None:
+                    Application(terminal, config["scrollback"]).run()
+                elif script_path == "-":
+                    HeadlessApplication(terminal, sys.stdin).run()
+                else:
+                    with open(script_path, "r", encoding="UTF-8") as script:
+                        HeadlessApplication(terminal, script).run()
+            finally:
+                terminal.close()
+                close_filesystem(file_system)
+        except FileNotFoundError as e:
+            print(f"Файл {e.filename} не найден.")
     else:
         print("Аргументы не были переданы.")
 
@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from main import Terminal, LogWriter, read_config, open_filesystem, close_filesystem
+from commands import COMMANDS
+
+
+class SessionApplication:
+    """
+    Вывод сеанса в сокет: тот же интерфейс print/exit, что и у Application.
+    Команда выполняется в потоке пула под блокировкой файловой системы, и её
+    вывод только копится в памяти. В сокет он передаётся в цикле событий
+    после снятия блокировки, порциями по flush_size байт с ожиданием
+    writer.drain(): клиент, переставший читать, задерживает лишь свой сеанс.
+    """
+    flush_size = 1 << 16
+
+    def __init__(self, terminal, writer):
+        self.writer = writer
+        self.running = True
+        self.pending = []
+        self.terminal = terminal
+        self.terminal.link(self)
+
+    def print(self, text, type):
+        if type != "input":
+            self.pending.append(f"{text}\n".encode("utf-8"))
+
+    async def flush(self):
+        """Передача накопленного вывода команды."""
+        pending, self.pending = self.pending, []
+        chunk, size = [], 0
+        for data in pending:
+            chunk.append(data)
+            size += len(data)
+            if size >= self.flush_size:
+                self.writer.write(b"".join(chunk))
+                chunk, size = [], 0
+                await self.writer.drain()
+        if chunk:
+            self.writer.write(b"".join(chunk))
+
+    def prompt(self):
+        self.writer.write(f"{self.terminal.username}:~{self.terminal.path}$ ".encode("utf-8"))
+
+    def exit(self):
+        self.running = False
+
+
+class ReadWriteLock:
+    """
+    Блокировка файловой системы для команд в пуле потоков: команды чтения
+    выполняются одновременно, изменяющая команда - одна. Ожидающая запись
+    задерживает новые чтения, чтобы непрерывный поток чтений её не откладывал.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writers_waiting = 0
+        self.writing = False
+
+    @contextmanager
+    def shared(self):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.writing and self.writers_waiting == 0)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self.condition:
+            self.writers_waiting += 1
+            self.condition.wait_for(lambda: not self.writing and self.readers == 0)
+            self.writers_waiting -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+
+class ShellServer:
+    """
+    Сервер эмулятора для нескольких сеансов.
+    У каждого подключения свой Terminal (текущий путь и имя пользователя),
+    а файловая система, её индекс и журнал команд общие. Команды выполняются
+    в пуле из workers потоков, чтобы чтение архива не останавливало цикл
+    событий: команды чтения - параллельно, изменяющие команды ставятся
+    в очередь единственной задачи записи и выполняются под исключительной
+    блокировкой. Журнал закрывается в close при остановке сервера.
+    """
+    def __init__(self, config, workers=32):
+        self.config = config
+        self.filesystem = open_filesystem(config["filesystem_path"])
+        self.log = LogWriter(config["log_path"], config["fsync_every"])
+        self.lock = ReadWriteLock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.queue = None
+
+    def execute(self, terminal, line, mutates):
+        """Выполнение команды в потоке пула; вывод передаётся после снятия блокировки."""
+        with self.lock.exclusive() if mutates else self.lock.shared():
+            terminal.command_dispatcher(line)
+
+    async def writer_task(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            terminal, line, done = await self.queue.get()
+            try:
+                await loop.run_in_executor(self.executor, self.execute, terminal, line, True)
+                done.set_result(None)
+            except Exception as e:
+                done.set_exception(e)
+
+    def mutates(self, line):
+        for part in line.split("|"):
+            words = part.split()
+            if words and words[0] in COMMANDS and COMMANDS[words[0]].mutates:
+                return True
+        return False
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        terminal = Terminal(self.config["username"], self.config["filesystem_path"], self.filesystem,
+                            self.config["log_path"], log=self.log)
+        application = SessionApplication(terminal, writer)
+        try:
+            application.prompt()
+            await writer.drain()
+            while application.running:
+                data = await reader.readline()
+                if not data:
+                    break
+                line = data.decode("utf-8", errors="replace").strip()
+                if line:
+                    if self.mutates(line):
+                        done = loop.create_future()
+                        await self.queue.put((terminal, line, done))
+                        await done
+                    else:
+                        await loop.run_in_executor(self.executor, self.execute, terminal, line, False)
+                    await application.flush()
+                if application.running:
+                    application.prompt()
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=None, port=None, unix_path=None):
+        self.queue = asyncio.Queue()
+        writer = asyncio.create_task(self.writer_task())
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle, unix_path, backlog=1024)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"Сервер слушает {addresses}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer.cancel()
+
+    def close(self):
+        self.executor.shutdown()
+        self.log.close()
+        close_filesystem(self.filesystem)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервер эмулятора оболочки для нескольких сеансов")
+    parser.add_argument("config", help="Путь к config.csv")
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес для TCP")
+    parser.add_argument("--port", type=int, default=8022, help="Порт для TCP")
+    parser.add_argument("--unix", help="Путь к Unix-сокету вместо TCP")
+    parser.add_argument("--workers", type=int, default=32, help="Число потоков выполнения команд")
+    args = parser.parse_args()
+    try:
+        server = ShellServer(read_config(args.config), args.workers)
+    except FileNotFoundError as e:
+        print(f"Файл {e.filename} не найден.")
+        return
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,13 @@
 from main import Terminal
 from main import Application
+from main import LogWriter
+from main import HeadlessApplication
+from vfs import ArchiveIndex, Overlay, DirectoryTree
+from time import perf_counter
+from zipfile import ZIP_DEFLATED
+import io
+import tkinter as tk
+import csv
 from types import NoneType
 import pytest
 from zipfile import ZipFile
@@ -81,3 +89,501 @@ def test_touch_2(terminal, capfd):
 def test_touch_3(terminal, capfd):
     terminal.touch(["test.png"])
     assert NoneType
+
+class StubApplication:
+    def __init__(self):
+        self.lines = []
+
+    def print(self, text, type):
+        self.lines.append((text, type))
+
+    def exit(self):
+        pass
+
+@pytest.fixture
+def stub_terminal(tmp_path):
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w") as archive:
+        archive.writestr("docs/readme.txt", "readme")
+        archive.writestr("docs/notes/a.txt", "a")
+        archive.writestr("src/", "")
+    t = Terminal("MyComputer", str(fs_path), ZipFile(fs_path, "a"), str(tmp_path / "log.csv"))
+    t.link(StubApplication())
+    return t
+
+def test_tree_ls_root(stub_terminal):
+    stub_terminal.command_dispatcher("ls")
+    assert stub_terminal.application.lines[-1] == ("docs\nsrc", "command")
+
+def test_tree_cd_nested(stub_terminal):
+    assert stub_terminal.cd(["docs/notes"]) == "docs/notes/"
+    assert stub_terminal.cd(["docs/readme.txt"]) is None
+
+def test_tree_touch_sync(stub_terminal):
+    stub_terminal.path = "src/"
+    stub_terminal.touch(["main.py"])
+    stub_terminal.command_dispatcher("ls")
+    assert stub_terminal.application.lines[-1] == ("main.py", "command")
+
+def test_touch_unique_names(stub_terminal):
+    stub_terminal.path = "docs/"
+    for _ in range(2):
+        stub_terminal.touch(["readme.txt"])
+    stub_terminal.command_dispatcher("ls")
+    assert stub_terminal.application.lines[-1] == ("notes\nreadme.txt\nreadme_1.txt\nreadme_2.txt", "command")
+
+def test_touch_unique_names_in_subdirectory(stub_terminal):
+    stub_terminal.command_dispatcher("touch docs/readme.txt")
+    assert stub_terminal.filesystem.read("docs/readme.txt") == b"readme"
+    assert stub_terminal.tree.find("docs/readme_1.txt") is not None
+    stub_terminal.command_dispatcher("touch sub/x.txt")
+    stub_terminal.command_dispatcher("touch sub/x.txt")
+    assert stub_terminal.tree.listdir("sub") == ["x.txt", "x_1.txt"]
+    stub_terminal.command_dispatcher("cd docs")
+    stub_terminal.command_dispatcher("touch notes/a.txt")
+    assert stub_terminal.tree.listdir("docs/notes") == ["a.txt", "a_1.txt"]
+
+def test_touch_unique_names_without_extension(stub_terminal):
+    stub_terminal.touch(["src"])
+    stub_terminal.touch(["src"])
+    assert stub_terminal.tree.find("src_1") is not None
+    assert stub_terminal.tree.find("src_2") is not None
+
+def test_touch_unique_names_several_dots(stub_terminal):
+    stub_terminal.touch(["archive.tar.gz"])
+    stub_terminal.touch(["archive.tar.gz"])
+    assert stub_terminal.tree.find("archive.tar_1.gz") is not None
+
+@pytest.mark.parametrize("tail, expected", [
+    ("", (0, 5000)),
+    ("8\n", (8, 5000)),
+    ("\n200\n", (0, 200)),
+    ("8\n\n", (8, 5000)),
+    (" \n,\n", (0, 5000)),
+])
+def test_read_config_optional_rows(tmp_path, tail, expected):
+    from main import read_config
+    config_path = tmp_path / "config.csv"
+    config_path.write_text(f"MyComputer\nvfs.zip\nlog.csv\n{tail}", encoding="UTF-8")
+    config = read_config(config_path)
+    assert (config["fsync_every"], config["scrollback"]) == expected
+
+def test_log_writer_flush_on_close(tmp_path):
+    log = LogWriter(tmp_path / "log.csv", batch_size=1000, interval=60)
+    for i in range(10):
+        log.write(["2024-11-15 18:43:00", f"rev {i}"])
+    log.close()
+    with open(tmp_path / "log.csv", newline='') as log_file:
+        rows = list(csv.reader(log_file))
+    assert [row[1] for row in rows] == [f"rev {i}" for i in range(10)]
+
+def test_log_writer_fsync(tmp_path):
+    log = LogWriter(tmp_path / "log.csv", fsync_every=2, batch_size=1)
+    for i in range(5):
+        log.write(["2024-11-15 18:43:00", "ls"])
+    log.close()
+    log.write(["2024-11-15 18:43:01", "exit"])
+    log.close()
+    with open(tmp_path / "log.csv", newline='') as log_file:
+        assert len(list(csv.reader(log_file))) == 6
+
+def test_dispatcher_logs_command(stub_terminal):
+    stub_terminal.command_dispatcher("rev hello")
+    stub_terminal.command_dispatcher("exit")
+    with open(stub_terminal.log_path, newline='') as log_file:
+        assert [row[1] for row in csv.reader(log_file)] == ["rev hello", "exit"]
+
+def test_headless_replays_log(stub_terminal):
+    script = io.StringIO("2024-11-15 18:43:00,cd docs\nls\nexit\nrev never\n")
+    output, report = io.StringIO(), io.StringIO()
+    app = HeadlessApplication(stub_terminal, script, output, report)
+    app.run()
+    assert output.getvalue() == (
+        "MyComputer:~$ cd docs\n"
+        "MyComputer:~docs/$ ls\n"
+        "notes\nreadme.txt\n"
+        "MyComputer:~docs/$ exit\n"
+    )
+    assert len(app.latencies) == 3
+    assert "команд/с" in report.getvalue()
+    assert "p99=" in report.getvalue()
+
+@pytest.fixture
+def application(stub_terminal):
+    try:
+        app = Application(stub_terminal, scrollback=3)
+    except tk.TclError:
+        pytest.skip("tkinter не может открыть окно")
+    yield app
+    app.root.destroy()
+
+def test_print_batched(application):
+    application.print("a\nb", "command")
+    application.print("c", "error")
+    assert application.output.get("1.0", "end-1c") == ""
+    application.root.update()
+    assert application.output.get("1.0", "end-1c") == "a\nb\nc\n"
+
+def test_print_scrollback(application):
+    application.print("\n".join(str(i) for i in range(100000)), "command")
+    application.root.update()
+    application.print("tail", "command")
+    application.root.update()
+    assert application.output.get("1.0", "end-1c") == "99998\n99999\ntail\n"
+
+def test_overlay_touch_keeps_archive(stub_terminal):
+    stub_terminal.touch(["new.txt"])
+    assert "new.txt" in stub_terminal.filesystem.namelist()
+    with ZipFile(stub_terminal.fs_path) as archive:
+        assert "new.txt" not in archive.namelist()
+
+def test_overlay_compact(tmp_path):
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w") as archive:
+        archive.writestr("a.txt", "old")
+    with ZipFile(fs_path, "a") as archive, pytest.warns(UserWarning):
+        archive.writestr("a.txt", "new")
+    overlay = Overlay(ZipFile(fs_path), tmp_path / "vfs.journal")
+    overlay.writestr("dir/b.txt", "b")
+    overlay.compact()
+    assert not overlay.dirty
+    overlay.close()
+    with ZipFile(fs_path) as archive:
+        assert archive.namelist() == ["a.txt", "dir/b.txt"]
+        assert archive.read("a.txt") == b"new"
+    assert not (tmp_path / "vfs.journal").exists()
+
+def test_overlay_journal_recovery(tmp_path):
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w") as archive:
+        archive.writestr("a.txt", "a")
+    overlay = Overlay(ZipFile(fs_path), tmp_path / "vfs.journal")
+    overlay.writestr("b.txt", "b")
+    overlay.journal.close()  # Аварийное завершение без уплотнения
+    recovered = Overlay(ZipFile(fs_path), tmp_path / "vfs.journal")
+    assert recovered.read("b.txt") == b"b"
+    assert recovered.tree.find("b.txt") is not None
+
+def test_overlay_journal_other_archive(tmp_path):
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w") as archive:
+        archive.writestr("a.txt", "a")
+    overlay = Overlay(ZipFile(fs_path), tmp_path / "vfs.journal")
+    overlay.writestr("b.txt", "b")
+    overlay.journal.close()  # Аварийное завершение без уплотнения
+    overlay.base.close()
+    with ZipFile(fs_path, "w") as archive:  # Новый архив с тем же именем
+        archive.writestr("c.txt", "c")
+    fresh = Overlay(ZipFile(fs_path), tmp_path / "vfs.journal")
+    assert not fresh.dirty
+    assert fresh.tree.find("b.txt") is None
+    assert (tmp_path / "vfs.journal.stale").exists()
+    fresh.writestr("d.txt", "d")
+    fresh.journal.close()
+    recovered = Overlay(ZipFile(fs_path), tmp_path / "vfs.journal")
+    assert list(recovered.created) == ["d.txt"]
+    recovered.close()
+
+def test_archive_index_cache(tmp_path):
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w", ZIP_DEFLATED) as archive:
+        archive.writestr("dir/", "")
+        archive.writestr("dir/poem.txt", "Выткался на озере алый свет зари." * 1000)
+    index = ArchiveIndex.load(str(fs_path))
+    assert not index.cached
+    index.close()
+    index = ArchiveIndex.load(str(fs_path))
+    assert index.cached
+    assert index.namelist() == ["dir/", "dir/poem.txt"]
+    with ZipFile(fs_path) as archive:
+        assert index.read("dir/poem.txt") == archive.read("dir/poem.txt")
+    index.close()
+
+def test_archive_index_stale(tmp_path):
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w") as archive:
+        archive.writestr("a.txt", "a")
+    ArchiveIndex.load(str(fs_path)).close()
+    with ZipFile(fs_path, "a") as archive:
+        archive.writestr("b.txt", "b")
+    index = ArchiveIndex.load(str(fs_path))
+    assert not index.cached
+    assert index.namelist() == ["a.txt", "b.txt"]
+    index.close()
+
+@pytest.mark.parametrize("damage", ["tail", "names", "separator"])
+def test_archive_index_truncated(tmp_path, damage):
+    fs_path = tmp_path / "vfs.zip"
+    names = [f"d/f{i}.txt" for i in range(10)]
+    with ZipFile(fs_path, "w") as archive:
+        for name in names:
+            archive.writestr(name, name)
+    ArchiveIndex.load(str(fs_path)).close()
+    index_path = tmp_path / "vfs.zip.idx"
+    data = index_path.read_bytes()
+    if damage == "tail":
+        data = data[:-3]  # Последнее имя обрезано до d/f
+    elif damage == "names":
+        data = data[:ArchiveIndex.HEADER.size + len(names) * 26 + 9]  # Осталось одно имя
+    else:
+        position = data.rindex(b"\0")
+        data = data[:position] + b"x" + data[position + 1:]  # Длина верна, имён на одно меньше
+    index_path.write_bytes(data)
+    index = ArchiveIndex.load(str(fs_path))
+    assert not index.cached
+    assert index.namelist() == names
+    index.close()
+    index = ArchiveIndex.load(str(fs_path))
+    assert index.cached
+    index.close()
+
+def test_archive_index_terminal(tmp_path):
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w") as archive:
+        archive.writestr("docs/readme.txt", "readme")
+    t = Terminal("MyComputer", str(fs_path), Overlay(ArchiveIndex.load(str(fs_path))), str(tmp_path / "log.csv"))
+    t.link(StubApplication())
+    t.touch(["new.txt"])
+    t.sync()
+    assert t.filesystem.base.namelist() == ["docs/readme.txt", "new.txt"]
+    t.filesystem.close()
+
+def test_cat_streams_lines(stub_terminal):
+    text = "\n".join(f"строка {i}" for i in range(20000))
+    stub_terminal.filesystem.writestr("docs/big.txt", text)
+    stub_terminal.command_dispatcher("cat docs/big.txt")
+    printed = [line for line, type in stub_terminal.application.lines]
+    assert len(printed) > 1
+    assert "\n".join(printed) == text
+
+def test_cat_long_line_bounded(stub_terminal, monkeypatch):
+    from commands import COMMANDS
+    monkeypatch.setattr(COMMANDS["cat"], "max_line", 1 << 16)
+    text = "x" * (1 << 20)
+    stub_terminal.filesystem.writestr("docs/long.txt", text)
+    parts = list(COMMANDS["cat"].run(stub_terminal, ["docs/long.txt"], None))
+    assert len(parts) > 1
+    assert max(len(part) for part in parts) < 2 << 16
+    assert "".join(parts) == text
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_cat_damaged_member(tmp_path, indexed):
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w", ZIP_DEFLATED) as archive:
+        archive.writestr("poem.txt", "Выткался на озере алый свет зари.\n" * 1000)
+    data = bytearray(fs_path.read_bytes())
+    data[40:60] = b"\xff" * 20  # Испорченные сжатые данные
+    fs_path.write_bytes(bytes(data))
+    base = ArchiveIndex.load(str(fs_path)) if indexed else ZipFile(fs_path)
+    t = Terminal("MyComputer", str(fs_path), Overlay(base), str(tmp_path / "log.csv"))
+    t.link(StubApplication())
+    t.tree.add("ghost.txt")  # Есть в дереве, но нет в архиве
+    for name in ("poem.txt", "ghost.txt"):
+        t.command_dispatcher(f"cat {name}")
+        assert t.application.lines[-1] == ("Не удалось прочитать файл.", "error")
+    t.filesystem.close()
+    t.close()
+
+def test_cat_missing(stub_terminal):
+    stub_terminal.command_dispatcher("cat docs")
+    assert stub_terminal.application.lines[-1] == ("Файл с таким названием отсутствует.", "error")
+
+def test_du_incremental(stub_terminal):
+    stub_terminal.command_dispatcher("du")
+    assert stub_terminal.application.lines[-1] == ("7\tdocs\n0\tsrc\n7\t.", "command")
+    stub_terminal.filesystem.writestr("src/main.py", "print()")
+    stub_terminal.command_dispatcher("du src")
+    assert stub_terminal.application.lines[-1] == ("7\tsrc", "command")
+    assert stub_terminal.tree.root.size == 14
+
+def test_find_name(stub_terminal):
+    stub_terminal.command_dispatcher("find -name *.txt")
+    assert stub_terminal.application.lines[-1] == ("docs/notes/a.txt\ndocs/readme.txt", "command")
+    stub_terminal.path = "docs/"
+    stub_terminal.command_dispatcher("find notes")
+    assert stub_terminal.application.lines[-1] == ("docs/notes\ndocs/notes/a.txt", "command")
+
+def test_pipeline_rev(stub_terminal):
+    stub_terminal.command_dispatcher("ls docs | rev")
+    assert stub_terminal.application.lines[-1] == ("seton\ntxt.emdaer", "command")
+
+def test_pipeline_streams_lazily(stub_terminal):
+    stub_terminal.filesystem.writestr("big.txt", "\n".join(str(i) for i in range(2500)))
+    stub_terminal.command_dispatcher("cat big.txt | rev")
+    printed = stub_terminal.application.lines
+    assert len(printed) == 3
+    assert printed[0][0].split("\n")[:2] == ["0", "1"]
+    assert printed[-1][0].split("\n")[-1] == "9942"
+
+def test_pipeline_unknown_command(stub_terminal):
+    stub_terminal.command_dispatcher("ls | grep a")
+    assert stub_terminal.application.lines == [("Работа данной команды не предусмотрена в данном эмуляторе.", "error")]
+
+def test_pipeline_runs_unread_stages(stub_terminal):
+    stub_terminal.command_dispatcher("touch x.txt | uname")
+    assert stub_terminal.tree.find("x.txt") is not None
+
+def test_registry_and_timing_hooks(stub_terminal):
+    from commands import Command, COMMANDS
+    class Echo(Command):
+        name = "echo"
+        def run(self, terminal, args, stdin):
+            yield " ".join(args)
+    timings = []
+    stub_terminal.timing_hooks.append(lambda name, args, elapsed: timings.append((name, elapsed)))
+    try:
+        stub_terminal.command_dispatcher("echo abc | rev")
+    finally:
+        del COMMANDS["echo"]
+    assert stub_terminal.application.lines[-1] == ("cba", "command")
+    assert [name for name, elapsed in timings] == ["echo", "rev"]
+    assert all(elapsed >= 0 for name, elapsed in timings)
+
+def test_timing_hooks_drained_stage(stub_terminal):
+    import time
+    from commands import Command, COMMANDS
+    class Slow(Command):
+        name = "slow"
+        def run(self, terminal, args, stdin):
+            for i in range(3):
+                time.sleep(0.01)
+                yield str(i)
+    timings = {}
+    stub_terminal.timing_hooks.append(lambda name, args, elapsed: timings.__setitem__(name, elapsed))
+    try:
+        # uname не читает ввод: вывод slow вычитывается уже после uname
+        stub_terminal.command_dispatcher("slow | uname")
+    finally:
+        del COMMANDS["slow"]
+    assert timings["slow"] >= 0.03
+    assert 0 <= timings["uname"] < timings["slow"]
+
+def test_server_sessions_share_vfs(tmp_path):
+    import asyncio
+    from server import ShellServer
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w") as archive:
+        archive.writestr("docs/readme.txt", "readme")
+    config = {"username": "MyComputer", "filesystem_path": str(fs_path), "log_path": str(tmp_path / "log.csv"), "fsync_every": 0}
+    server = ShellServer(config)
+
+    async def command(reader, writer, line):
+        writer.write(f"{line}\n".encode())
+        return (await reader.readuntil(b"$ ")).decode()
+
+    async def scenario():
+        server.queue = asyncio.Queue()
+        writer_task = asyncio.create_task(server.writer_task())
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        first = await asyncio.open_connection("127.0.0.1", port)
+        second = await asyncio.open_connection("127.0.0.1", port)
+        for reader, writer in (first, second):
+            await reader.readuntil(b"$ ")
+        assert await command(*first, "cd docs") == "MyComputer:~docs/$ "
+        assert await command(*second, "touch new.txt") == "MyComputer:~$ "
+        assert await command(*first, "ls /") == "docs\nnew.txt\nMyComputer:~docs/$ "
+        for reader, writer in (first, second):
+            writer.close()
+        listener.close()
+        writer_task.cancel()
+
+    asyncio.run(scenario())
+    server.close()
+    with ZipFile(fs_path) as archive:
+        assert "new.txt" in archive.namelist()
+
+def test_server_exit_keeps_shared_log(tmp_path):
+    import asyncio
+    from server import ShellServer
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w") as archive:
+        for i in range(5000):
+            archive.writestr(f"docs/file_{i}.txt", "")
+    config = {"username": "MyComputer", "filesystem_path": str(fs_path), "log_path": str(tmp_path / "log.csv"), "fsync_every": 0}
+    server = ShellServer(config, workers=4)
+
+    async def scenario():
+        server.queue = asyncio.Queue()
+        writer_task = asyncio.create_task(server.writer_task())
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        first = await asyncio.open_connection("127.0.0.1", port)
+        second = await asyncio.open_connection("127.0.0.1", port, limit=1 << 20)
+        for reader, writer in (first, second):
+            await reader.readuntil(b"$ ")
+        first[1].write(b"exit\n")
+        assert await first[0].read() == b""
+        # Вывод больше flush_size передаётся порциями с ожиданием drain
+        second[1].write(b"ls /docs\n")
+        output = (await second[0].readuntil(b"$ ")).decode()
+        assert output.count("\n") == 5000
+        assert server.log.thread is not None  # Общий журнал открыт после exit другого сеанса
+        for reader, writer in (first, second):
+            writer.close()
+        listener.close()
+        writer_task.cancel()
+
+    asyncio.run(scenario())
+    server.close()
+    with open(tmp_path / "log.csv", newline='') as log_file:
+        assert [row[1] for row in csv.reader(log_file)] == ["exit", "ls /docs"]
+
+def test_server_stalled_client(tmp_path):
+    import asyncio
+    from server import ShellServer
+    fs_path = tmp_path / "vfs.zip"
+    with ZipFile(fs_path, "w") as archive:
+        archive.writestr("big.txt", "\n".join("x" * 100 for _ in range(200000)))
+    config = {"username": "MyComputer", "filesystem_path": str(fs_path), "log_path": str(tmp_path / "log.csv"), "fsync_every": 0}
+    server = ShellServer(config, workers=4)
+
+    async def command(reader, writer, line):
+        writer.write(f"{line}\n".encode())
+        return (await reader.readuntil(b"$ ")).decode()
+
+    async def scenario():
+        server.queue = asyncio.Queue()
+        writer_task = asyncio.create_task(server.writer_task())
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        sessions = [await asyncio.open_connection("127.0.0.1", port) for _ in range(3)]
+        for reader, writer in sessions:
+            await reader.readuntil(b"$ ")
+        # Первый клиент не читает вывод cat: его сеанс ждёт drain
+        sessions[0][1].write(b"cat big.txt\n")
+        await asyncio.sleep(0.5)
+        assert await asyncio.wait_for(command(*sessions[1], "touch new.txt"), 3) == "MyComputer:~$ "
+        assert await asyncio.wait_for(command(*sessions[2], "ls"), 3) == "big.txt\nnew.txt\nMyComputer:~$ "
+        for reader, writer in sessions:
+            writer.close()
+        listener.close()
+        writer_task.cancel()
+
+    asyncio.run(scenario())
+    server.close()
+
+def test_complete_command(stub_terminal):
+    assert stub_terminal.complete("ca") == ("cat ", ["cat"])
+    assert stub_terminal.complete("ls | c") == ("ls | c", ["cat", "cd"])
+
+def test_complete_path(stub_terminal):
+    assert stub_terminal.complete("cd d") == ("cd docs/", ["docs"])
+    assert stub_terminal.complete("cat docs/r") == ("cat docs/readme.txt ", ["readme.txt"])
+    assert stub_terminal.complete("cd ../d") == ("cd ../d", [])
+
+def test_complete_large_directory(stub_terminal):
+    stub_terminal.tree = DirectoryTree([f"big/file_{i:06d}.txt" for i in range(100000)])
+    assert stub_terminal.complete("cat big/file_09999") == ("cat big/file_09999", [f"file_09999{i}.txt" for i in range(10)])
+    timings = []
+    for _ in range(5):
+        start = perf_counter()
+        stub_terminal.complete("cat big/file_0999")
+        timings.append(perf_counter() - start)
+    assert min(timings) < 0.001
+
+def test_benchmark_smoke(tmp_path):
+    from benchmark import run_case
+    results = run_case(str(tmp_path), 200, "deep", ["ls", "cd", "touch"], 5, 0)
+    assert [result["command"] for result in results] == ["startup_scan", "startup_cached", "ls", "cd", "touch"]
+    assert all(result["ops_per_sec"] > 0 and result["peak_kib"] > 0 for result in results)
@@ -0,0 +1,467 @@
+import base64
+import hashlib
+import io
+import json
+import mmap
+import os
+import shutil
+import struct
+import zlib
+from array import array
+from time import perf_counter
+from bisect import bisect_left, insort
+from os.path import splitext
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP64_LIMIT
+
+
+class Node:
+    __slots__ = ("name", "is_dir", "children", "order", "suffixes", "size")
+
+    def __init__(self, name, is_dir):
+        self.name = name
+        self.is_dir = is_dir
+        self.size = 0  # Размер файла или суммарный размер содержимого директории
+        self.children = {} if is_dir else None
+        self.order = [] if is_dir else None  # Имена потомков в отсортированном порядке
+        self.suffixes = None  # Следующий свободный номер для каждого запрошенного имени
+
+
+class DirectoryTree:
+    """
+    Префиксное дерево путей архива.
+    Строится один раз по списку имён ZipFile, далее поиск директории
+    занимает O(глубина), а вывод содержимого - O(количество элементов).
+    Каждая директория хранит суммарный размер своего содержимого.
+    """
+    def __init__(self, names=(), sizes=None):
+        self.root = Node("", True)
+        if sizes is None:
+            sizes = [0] * len(names)
+        for name, size in zip(names, sizes):
+            self._insert(name, size, sort=False)
+        self._sort(self.root)
+
+    def _insert(self, name, size=0, sort=True):
+        parts = name.split('/')
+        is_dir = name.endswith('/')
+        if is_dir:
+            parts.pop()
+        node = self.root
+        path = [node]
+        for i, part in enumerate(parts):
+            if not part:
+                continue
+            child = node.children.get(part)
+            last = i == len(parts) - 1
+            if child is None:
+                child = Node(part, is_dir or not last)
+                node.children[part] = child
+                if sort:
+                    insort(node.order, part)
+                else:
+                    node.order.append(part)
+            elif not last and not child.is_dir:
+                # Файл и директория с одинаковым именем: путь внутри побеждает
+                self._resize(path + [child], -child.size)
+                child.is_dir = True
+                child.children = {}
+                child.order = []
+            node = child
+            path.append(node)
+        if not node.is_dir:
+            # Повторный член архива с тем же именем заменяет прежний
+            self._resize(path, size - node.size)
+        return node
+
+    @staticmethod
+    def _resize(path, delta):
+        for node in path:
+            node.size += delta
+
+    def _sort(self, node):
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            current.order.sort()
+            stack.extend(child for child in current.children.values() if child.is_dir)
+
+    def add(self, name, size=0):
+        return self._insert(name, size)
+
+    def unique_name(self, path, filename):
+        """
+        Подбор свободного имени в директории path.
+        Имя может содержать путь (d/f.txt): занятость проверяется в той
+        директории, где окажется файл. Для каждого запрошенного имени хранится
+        следующий номер, поэтому повторные вызовы не перебирают занятые варианты.
+        """
+        directory, slash, filename = filename.rpartition('/')
+        node = self.find(f"{path}{directory}")
+        if node is None or not node.is_dir or filename not in node.children:
+            return directory + slash + filename
+        if node.suffixes is None:
+            node.suffixes = {}
+        stem, extension = splitext(filename)
+        counter = node.suffixes.get(filename, 1)
+        candidate = f"{stem}_{counter}{extension}"
+        while candidate in node.children:
+            counter += 1
+            candidate = f"{stem}_{counter}{extension}"
+        node.suffixes[filename] = counter + 1
+        return directory + slash + candidate
+
+    def find(self, path):
+        node = self.root
+        for part in path.split('/'):
+            if not part:
+                continue
+            node = node.children.get(part) if node.is_dir else None
+            if node is None:
+                return None
+        return node
+
+    def listdir(self, path):
+        node = self.find(path)
+        if node is None or not node.is_dir:
+            return None
+        return node.order
+
+    def complete(self, path, prefix, limit=100):
+        """
+        Дополнение имени в директории path двоичным поиском по отсортированному
+        списку потомков: (общий префикс совпадений, первые limit совпадений).
+        """
+        node = self.find(path)
+        if node is None or not node.is_dir:
+            return prefix, []
+        return complete_sorted(node.order, prefix, limit)
+
+    def walk(self, path):
+        """Обход поддерева в глубину в отсортированном порядке: пары (путь, узел)."""
+        node = self.find(path)
+        if node is None:
+            return
+        stack = [(path.rstrip('/'), node)]
+        while stack:
+            current_path, current = stack.pop()
+            yield current_path, current
+            if current.is_dir:
+                prefix = f"{current_path}/" if current_path else ""
+                stack.extend((prefix + name, current.children[name]) for name in reversed(current.order))
+
+
+def complete_sorted(names, prefix, limit=100):
+    low = bisect_left(names, prefix)
+    high = bisect_left(names, prefix[:-1] + chr(ord(prefix[-1]) + 1)) if prefix else len(names)
+    if low >= high:
+        return prefix, []
+    # Общий префикс всех имён в отсортированном диапазоне равен общему префиксу крайних
+    first, last = names[low], names[high - 1]
+    common = len(prefix)
+    while common < min(len(first), len(last)) and first[common] == last[common]:
+        common += 1
+    return first[:common], names[low:min(high, low + limit)]
+
+
+class MemberReader(io.RawIOBase):
+    """Потоковое чтение члена архива по смещению локального заголовка без ZipFile."""
+    def __init__(self, path, offset, compressed_size, method):
+        self.file = open(path, 'rb')
+        self.file.seek(offset)
+        header = self.file.read(30)
+        if len(header) != 30 or header[:4] != b"PK\x03\x04":
+            self.file.close()
+            raise OSError("Повреждённый локальный заголовок архива")
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        self.file.seek(name_length + extra_length, os.SEEK_CUR)
+        self.remaining = compressed_size
+        self.decompressor = zlib.decompressobj(-15) if method == 8 else None
+        self.tail = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = len(buffer)
+        while True:
+            if self.decompressor is None:
+                data = self.file.read(min(size, self.remaining))
+                self.remaining -= len(data)
+            else:
+                if not self.tail and self.remaining > 0:
+                    self.tail = self.file.read(min(1 << 16, self.remaining))
+                    self.remaining -= len(self.tail)
+                data = self.decompressor.decompress(self.tail, size)
+                self.tail = self.decompressor.unconsumed_tail
+            if data or (self.remaining == 0 and not self.tail):
+                buffer[:len(data)] = data
+                return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class ArchiveIndex:
+    """
+    Компактный индекс центрального каталога архива.
+    Имена, смещения, размеры и способы сжатия членов хранятся в массивах
+    и сохраняются рядом с архивом в файле <архив>.idx. Индекс привязан к
+    размеру, времени изменения и хэшу хвоста архива; при запуске он
+    отображается в память через mmap, и ZipInfo для членов не создаются.
+    """
+    MAGIC = b"VFSIDX01"
+    HEADER = struct.Struct("<8sQQ20sQQ4x")  # Сигнатура, размер, mtime, хэш хвоста, число членов, длина имён
+    TAIL_SIZE = 1 << 16
+
+    def __init__(self, filename, names, offsets, compressed_sizes, sizes, methods, cached=False):
+        self.filename = filename
+        self.names = names
+        self.offsets = offsets
+        self.compressed_sizes = compressed_sizes
+        self.sizes = sizes
+        self.methods = methods
+        self.cached = cached
+        self.load_time = 0.0
+        self.positions = None
+        self.mapping = None
+        self.fallback = None
+
+    @staticmethod
+    def fingerprint(path):
+        stat = os.stat(path)
+        with open(path, 'rb') as archive:
+            archive.seek(max(stat.st_size - ArchiveIndex.TAIL_SIZE, 0))
+            digest = hashlib.sha1(archive.read()).digest()
+        return stat.st_size, stat.st_mtime_ns, digest
+
+    @classmethod
+    def load(cls, path, index_path=None):
+        """Загрузка индекса из кэша или, если он устарел, полным сканированием архива."""
+        start = perf_counter()
+        index_path = index_path or f"{path}.idx"
+        key = cls.fingerprint(path)
+        index = cls._read(path, index_path, key)
+        if index is None:
+            index = cls.scan(path)
+            index.save(index_path, key)
+        index.load_time = perf_counter() - start
+        return index
+
+    @classmethod
+    def scan(cls, path):
+        with ZipFile(path) as archive:
+            infos = archive.infolist()
+        return cls(
+            path,
+            [info.filename for info in infos],
+            array('Q', (info.header_offset for info in infos)),
+            array('Q', (info.compress_size for info in infos)),
+            array('Q', (info.file_size for info in infos)),
+            array('H', (info.compress_type for info in infos)),
+        )
+
+    @classmethod
+    def _read(cls, path, index_path, key):
+        try:
+            with open(index_path, 'rb') as index_file:
+                mapping = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(mapping) < cls.HEADER.size:
+            mapping.close()
+            return None
+        magic, size, mtime, digest, count, names_length = cls.HEADER.unpack_from(mapping)
+        # Обрезанный или повреждённый файл индекса не используется: архив сканируется заново
+        if (magic != cls.MAGIC or (size, mtime, digest) != key
+                or len(mapping) != cls.HEADER.size + count * 26 + names_length):
+            mapping.close()
+            return None
+        position = cls.HEADER.size + count * 24
+        try:
+            names = mapping[position + count * 2:].decode('utf-8').split('\0') if count else []
+        except UnicodeDecodeError:
+            names = None
+        if names is None or len(names) != count:
+            mapping.close()
+            return None
+        view = memoryview(mapping)
+        position = cls.HEADER.size
+        columns = []
+        for item_size, code in ((8, 'Q'), (8, 'Q'), (8, 'Q'), (2, 'H')):
+            columns.append(view[position:position + count * item_size].cast(code))
+            position += count * item_size
+        index = cls(path, names, *columns, cached=True)
+        index.mapping = (mapping, view)
+        return index
+
+    def save(self, index_path, key):
+        temp_path = f"{index_path}.tmp"
+        names = '\0'.join(self.names).encode('utf-8')
+        try:
+            with open(temp_path, 'wb') as index_file:
+                index_file.write(self.HEADER.pack(self.MAGIC, *key, len(self.names), len(names)))
+                for column in (self.offsets, self.compressed_sizes, self.sizes, self.methods):
+                    index_file.write(column.tobytes() if isinstance(column, array) else bytes(column))
+                index_file.write(names)
+            os.replace(temp_path, index_path)
+        except OSError:
+            pass  # Без кэша индекса архив просто будет сканироваться заново
+
+    def namelist(self):
+        return list(self.names)
+
+    def position(self, name):
+        if self.positions is None:
+            self.positions = {member: i for i, member in enumerate(self.names)}
+        return self.positions[name]
+
+    def file_size(self, name):
+        return self.sizes[self.position(name)]
+
+    def open(self, name):
+        i = self.position(name)
+        if self.methods[i] in (0, 8):
+            return io.BufferedReader(MemberReader(self.filename, self.offsets[i], self.compressed_sizes[i], self.methods[i]))
+        if self.fallback is None:
+            self.fallback = ZipFile(self.filename)
+        return self.fallback.open(name)
+
+    def read(self, name):
+        with self.open(name) as member:
+            return member.read()
+
+    def close(self):
+        if self.fallback is not None:
+            self.fallback.close()
+            self.fallback = None
+        if self.mapping is not None:
+            mapping, view = self.mapping
+            self.offsets = self.compressed_sizes = self.sizes = self.methods = None
+            view.release()
+            mapping.close()
+            self.mapping = None
+
+
+class Overlay:
+    """
+    Слой изменений поверх архива, открытого только для чтения.
+    Созданные файлы хранятся в памяти и (если задан journal_path) дописываются
+    в журнал, из которого восстанавливаются после аварийного завершения.
+    Архив переписывается целиком только при уплотнении (compact).
+    """
+    def __init__(self, base: ZipFile, journal_path=None):
+        self.base = base
+        self.filename = base.filename
+        self.created = {}
+        if isinstance(base, ZipFile):
+            infos = base.infolist()
+            self.tree = DirectoryTree([info.filename for info in infos], [info.file_size for info in infos])
+        else:
+            self.tree = DirectoryTree(base.names, base.sizes)
+        self.journal_path = journal_path
+        self.journal = None
+        if journal_path is not None:
+            self._replay()
+            self._open_journal('a')
+
+    def _header(self):
+        """Первая строка журнала: отпечаток архива, поверх которого записаны изменения."""
+        size, mtime, digest = ArchiveIndex.fingerprint(self.filename)
+        return json.dumps({"archive": [size, mtime, digest.hex()]}) + "\n"
+
+    def _open_journal(self, mode):
+        self.journal = open(self.journal_path, mode, encoding='utf-8')
+        if self.journal.tell() == 0:
+            self.journal.write(self._header())
+            self.journal.flush()
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as journal:
+            matches = journal.readline() == self._header()
+            for line in journal if matches else ():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Оборванная последняя запись
+                self._apply(entry["name"], base64.b64decode(entry["data"]))
+        if not matches:
+            # Журнал записан для другого архива с тем же именем: он не применяется,
+            # но сохраняется рядом, чтобы созданные файлы можно было восстановить вручную
+            os.replace(self.journal_path, f"{self.journal_path}.stale")
+
+    def _apply(self, name, data):
+        self.created[name] = data
+        self.tree.add(name, len(data))
+
+    @property
+    def dirty(self):
+        return len(self.created) > 0
+
+    def namelist(self):
+        names = dict.fromkeys(self.base.namelist())
+        names.update(dict.fromkeys(self.created))
+        return list(names)
+
+    def writestr(self, name, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.journal is not None:
+            entry = {"name": name, "data": base64.b64encode(data).decode('ascii')}
+            self.journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.journal.flush()
+        self._apply(name, data)
+
+    def open(self, name):
+        if name in self.created:
+            return io.BytesIO(self.created[name])
+        return self.base.open(name)
+
+    def read(self, name):
+        with self.open(name) as member:
+            return member.read()
+
+    def compact(self, target=None):
+        """Запись нового архива: последняя версия каждого члена архива плюс созданные файлы."""
+        target = target or self.filename
+        temp_path = f"{target}.tmp"
+        source_archive = self.base if isinstance(self.base, ZipFile) else ZipFile(self.filename)
+        latest = {}
+        for info in source_archive.infolist():
+            if info.filename not in self.created:
+                latest[info.filename] = info
+        with ZipFile(temp_path, 'w') as archive:
+            for info in latest.values():
+                copy = ZipInfo(info.filename, info.date_time)
+                copy.compress_type = info.compress_type
+                copy.external_attr = info.external_attr
+                if info.is_dir():
+                    archive.writestr(copy, b"")
+                    continue
+                with source_archive.open(info) as source, \
+                        archive.open(copy, 'w', force_zip64=info.file_size >= ZIP64_LIMIT) as destination:
+                    shutil.copyfileobj(source, destination, 1 << 20)
+            for name, data in self.created.items():
+                archive.writestr(name, data, compress_type=ZIP_DEFLATED)
+        if source_archive is not self.base:
+            source_archive.close()
+        if os.path.abspath(target) != os.path.abspath(self.filename):
+            os.replace(temp_path, target)
+            return
+        self.base.close()
+        os.replace(temp_path, target)
+        self.base = ArchiveIndex.load(target) if isinstance(self.base, ArchiveIndex) else ZipFile(target)
+        self.created = {}
+        if self.journal is not None:
+            self.journal.close()
+            self._open_journal('w')
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+            if not self.created:
+                os.remove(self.journal_path)
+        self.base.close()